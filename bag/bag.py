@@ -0,0 +1,144 @@
+import hashlib
+import json
+
+
+class BagLine:
+    """ A single product (and optional size) in the bag """
+
+    __slots__ = ('item_id', 'size', 'quantity')
+
+    def __init__(self, item_id, size, quantity):
+        self.item_id = item_id
+        self.size = size
+        self.quantity = quantity
+
+    def __repr__(self):
+        return f'BagLine({self.item_id!r}, {self.size!r}, {self.quantity!r})'
+
+
+class Bag:
+    """
+    The shopping bag, stored in the session as a small versioned payload:
+
+        {'v': 2, 'l': [[item_id, size, quantity], ...]}
+
+    Lines are indexed by (item_id, size) so adding, adjusting and removing a
+    line are all O(1). Sessions holding the legacy {item_id: qty} /
+    {item_id: {'items_by_size': {...}}} structure are migrated on load.
+    """
+
+    SESSION_KEY = 'bag'
+    VERSION = 2
+
+    def __init__(self, lines=()):
+        self._lines = {}
+        self.count = 0
+        for item_id, size, quantity in lines:
+            # Payloads written before add() rejected non-positive quantities
+            if quantity > 0:
+                self.set(item_id, quantity, size)
+
+    @classmethod
+    def from_payload(cls, payload):
+        """ Build a bag from a session payload in either format """
+        if not payload:
+            return cls()
+        if payload.get('v') == cls.VERSION:
+            return cls(payload['l'])
+        return cls(cls._legacy_lines(payload))
+
+    @staticmethod
+    def _legacy_lines(payload):
+        for item_id, item_data in payload.items():
+            if isinstance(item_data, int):
+                yield item_id, None, item_data
+            else:
+                for size, quantity in item_data['items_by_size'].items():
+                    yield item_id, size, quantity
+
+    @classmethod
+    def from_session(cls, session):
+        """
+        Load the bag from the session, rewriting legacy payloads in the
+        current format so they are only migrated once.
+        """
+        payload = session.get(cls.SESSION_KEY)
+        bag = cls.from_payload(payload)
+        if payload and payload.get('v') != cls.VERSION:
+            bag.save(session)
+        return bag
+
+    def save(self, session):
+        session[self.SESSION_KEY] = self.to_payload()
+
+    def to_payload(self):
+        return {
+            'v': self.VERSION,
+            'l': [[line.item_id, line.size, line.quantity]
+                  for line in self._lines.values()],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_payload(), separators=(',', ':'))
+
+    def digest(self):
+        """ Stable hash of the bag contents, independent of line order """
+        lines = sorted(
+            (line.item_id, line.size or '', line.quantity)
+            for line in self._lines.values())
+        return hashlib.sha1(json.dumps(lines).encode()).hexdigest()
+
+    def quantity(self, item_id, size=None):
+        line = self._lines.get((int(item_id), size))
+        return line.quantity if line else 0
+
+    def __contains__(self, key):
+        item_id, size = key
+        return (int(item_id), size) in self._lines
+
+    def add(self, item_id, quantity, size=None):
+        """
+        Add to a line, creating it if needed. Returns the new quantity.
+        Raises ValueError if quantity isn't positive.
+        """
+        if quantity <= 0:
+            raise ValueError(f'Quantity must be positive, not {quantity}')
+        item_id = int(item_id)
+        line = self._lines.get((item_id, size))
+        if line is None:
+            line = self._lines[(item_id, size)] = BagLine(item_id, size, 0)
+        line.quantity += quantity
+        self.count += quantity
+        return line.quantity
+
+    def set(self, item_id, quantity, size=None):
+        """ Set a line's quantity; zero or less removes the line """
+        if quantity <= 0:
+            if (item_id, size) in self:
+                self.remove(item_id, size)
+            return
+        item_id = int(item_id)
+        line = self._lines.get((item_id, size))
+        if line is None:
+            self._lines[(item_id, size)] = BagLine(item_id, size, quantity)
+        else:
+            self.count -= line.quantity
+            line.quantity = quantity
+        self.count += quantity
+
+    def remove(self, item_id, size=None):
+        """ Remove a line. Raises KeyError if it isn't in the bag """
+        line = self._lines.pop((int(item_id), size))
+        self.count -= line.quantity
+
+    def product_ids(self):
+        return {item_id for item_id, _ in self._lines}
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __bool__(self):
+        return bool(self._lines)
@@ -1,56 +1,175 @@
 from decimal import Decimal
-from django.conf import settings
-from django.shortcuts import get_object_or_404
-from products.models import Product
 
-def bag_contents(request):
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from checkout import pricing
+from products.catalog import get_price_version
+from products.models import Product, BAG_PRODUCT_FIELDS
+from .bag import Bag
+
+# Computed bags only change when the session bag or a product does, and both
+# are part of the cache key, so the timeout just bounds memory use.
+BAG_SNAPSHOT_TIMEOUT = 60 * 60
+
+# Session key of the last grand total computed for the bag, shown in the nav
+TOTAL_SESSION_KEY = 'bag_total'
+
+
+class BagContents:
+    """
+    Lazily computed view of the shopping bag held in the session.
+
+    The product count and the navigation total are derived from the session
+    alone; line items and totals are only resolved from the database the
+    first time one of them is accessed.
+    """
+
+    def __init__(self, bag, session=None):
+        self.bag = bag
+        self.session = session
+        self.free_delivery_threshold = pricing.free_delivery_threshold()
 
-    bag_items = []
-    total = 0
-    product_count = 0
-    bag = request.session.get('bag', {})
+    @property
+    def product_count(self):
+        return self.bag.count
 
-    for item_id, item_data in bag.items():
+    @cached_property
+    def _lines(self):
+        """
+        Line items and subtotal, served from the snapshot cache when this
+        exact bag has already been priced against the current catalog.
+        """
+        if not self.bag:
+            return [], 0
 
-        if isinstance(item_data, int):
-            product = get_object_or_404(Product, pk=item_id)
-            total += item_data * product.price
-            product_count += item_data
-            bag_items.append({
-                'item_id': item_id,
-                'quantity': item_data,
+        version = get_price_version()
+        lines = cache.get(f'bag:snapshot:{version}:{self.bag.digest()}')
+        if lines is None:
+            lines = self._compute_lines()
+            # Keyed by the bag as priced, after dropping any missing products
+            cache.set(f'bag:snapshot:{version}:{self.bag.digest()}', lines, BAG_SNAPSHOT_TIMEOUT)
+        return lines
+
+    def _compute_lines(self):
+        """
+        Resolve every product in the bag with a single query. Lines of
+        products that no longer exist are removed from the bag, and from
+        the session, so the bag page, the payment amount and the order all
+        agree on what is being bought.
+        """
+        bag_items = []
+
+        products = (
+            Product.objects.select_related('category')
+            .only(*BAG_PRODUCT_FIELDS)
+            .in_bulk(self.bag.product_ids())
+        )
+
+        missing = []
+        for line in self.bag:
+            product = products.get(line.item_id)
+            if product is None:
+                missing.append(line)
+                continue
+
+            bag_item = {
+                'item_id': line.item_id,
+                'quantity': line.quantity,
                 'product': product,
-            })
-            
-        else:
-            product = get_object_or_404(Product, pk=item_id)
-            for size, quantity in item_data['items_by_size'].items():
-                total += quantity * product.price
-                product_count += quantity
-                bag_items.append({
-                    'item_id': item_id,
-                    'quantity': quantity,
-                    'product': product,
-                    'size': size,
-                })
-
-    if total < settings.FREE_DELIVERY_THRESHOLD:
-        delivery = total * Decimal(settings.STANDARD_DELIVERY_PERCENTAGE / 100)
-        free_delivery_delta = settings.FREE_DELIVERY_THRESHOLD - total
-    else:
-        delivery = 0
-        free_delivery_delta = 0
-    
-    grand_total = delivery + total
-    
-    context = {
-        'bag_items': bag_items,
-        'total': total,
-        'product_count': product_count,
-        'delivery': delivery,
-        'free_delivery_delta': free_delivery_delta,
-        'free_delivery_threshold': settings.FREE_DELIVERY_THRESHOLD,
-        'grand_total': grand_total,
-    }
-
-    return context
\ No newline at end of file
+            }
+            if line.size:
+                bag_item['size'] = line.size
+            bag_items.append(bag_item)
+
+        if missing:
+            for line in missing:
+                self.bag.remove(line.item_id, line.size)
+            if self.session is not None:
+                self.bag.save(self.session)
+
+        total = pricing.subtotal(
+            (item['product'].price, item['quantity']) for item in bag_items)
+        return bag_items, total
+
+    @property
+    def bag_items(self):
+        return self._lines[0]
+
+    @property
+    def total(self):
+        return self._lines[1]
+
+    @cached_property
+    def _totals(self):
+        totals = pricing.calculate(self.total)
+        self._remember_total(totals.grand_total)
+        return totals
+
+    def _remember_total(self, grand_total):
+        if self.session is None:
+            return
+        remembered = {'bag': self.bag.digest(), 'grand_total': str(grand_total)}
+        if self.session.get(TOTAL_SESSION_KEY) != remembered:
+            self.session[TOTAL_SESSION_KEY] = remembered
+
+    @property
+    def nav_total(self):
+        """
+        Grand total for the navigation badge. It is read from the session,
+        where it is kept whenever the bag is priced (the bag page, checkout
+        and the bag toast), so other pages don't touch the database. A price
+        change shows up once the bag is priced again. Only a bag that has
+        never been priced is priced here.
+        """
+        if not self.bag:
+            return None
+        remembered = self.session.get(TOTAL_SESSION_KEY) if self.session is not None else None
+        if remembered and remembered['bag'] == self.bag.digest():
+            return Decimal(remembered['grand_total'])
+        return self.grand_total
+
+    @property
+    def delivery(self):
+        return self._totals.delivery
+
+    @property
+    def free_delivery_delta(self):
+        return self._totals.free_delivery_delta
+
+    @property
+    def grand_total(self):
+        return self._totals.grand_total
+
+    def as_context(self):
+        """
+        Template context for the bag. Values that need the database are
+        passed as callables, which templates only call when they are used.
+        """
+        return {
+            'bag_items': lambda: self.bag_items,
+            'total': lambda: self.total,
+            'product_count': lambda: self.product_count,
+            'delivery': lambda: self.delivery,
+            'free_delivery_delta': lambda: self.free_delivery_delta,
+            'free_delivery_threshold': self.free_delivery_threshold,
+            'grand_total': lambda: self.grand_total,
+            'bag_nav_total': lambda: self.nav_total,
+        }
+
+
+def get_bag_contents(request):
+    """
+    Return the BagContents for this request, memoised on the request so
+    views and templates that ask for it again share the same instance.
+    """
+    contents = getattr(request, '_bag_contents', None)
+    if contents is None:
+        contents = BagContents(Bag.from_session(request.session), request.session)
+        request._bag_contents = contents
+    return contents
+
+
+def bag_contents(request):
+    """ Context processor exposing the lazily computed bag to templates """
+
+    return get_bag_contents(request).as_context()
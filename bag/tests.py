@@ -1,3 +1,153 @@
-from django.test import TestCase
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from products.catalog import bump_price_version, get_price_version
+from products.models import Product
+from .bag import Bag
+from .contexts import BagContents
 
 # Create your tests here.
+
+
+class BagContentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=Decimal('5.00'))
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_products_are_resolved_with_one_query(self):
+        bag = Bag()
+        for product in self.products:
+            bag.add(product.pk, 2)
+        bag.add(self.products[0].pk, 1, 's')
+        contents = BagContents(bag)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(contents.bag_items), 6)
+            self.assertEqual(contents.total, Decimal('55.00'))
+            # Names and categories are loaded with the products
+            [item['product'].category for item in contents.bag_items]
+
+    def test_deleted_products_are_skipped(self):
+        bag = Bag()
+        bag.add(self.products[0].pk, 1)
+        bag.add(99999, 1)
+        contents = BagContents(bag)
+        self.assertEqual([item['item_id'] for item in contents.bag_items], [self.products[0].pk])
+
+
+class BagSnapshotCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Shirt', description='', price=Decimal('10.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.bag = Bag()
+        self.bag.add(self.product.pk, 2)
+
+    def test_repeat_pricing_is_served_from_the_snapshot(self):
+        self.assertEqual(BagContents(self.bag).total, Decimal('20.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(BagContents(self.bag).total, Decimal('20.00'))
+
+    def test_price_change_invalidates_the_snapshot_once_committed(self):
+        BagContents(self.bag).total
+        version = get_price_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = Decimal('12.50')
+            self.product.save()
+        # Until the edit commits other requests still see the old price
+        self.assertEqual(get_price_version(), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_price_version(), version)
+        self.assertEqual(BagContents(self.bag).total, Decimal('25.00'))
+
+    def test_deleting_a_product_invalidates_the_snapshot(self):
+        BagContents(self.bag).total
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(BagContents(self.bag).bag_items, [])
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class LazyBagContextTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Shirt', description='', price=Decimal('10.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('add_to_bag', args=[self.product.pk]),
+                         {'quantity': 2, 'redirect_url': reverse('view_bag')})
+
+    def test_bag_page_prices_the_bag(self):
+        response = self.client.get(reverse('view_bag'))
+        self.assertEqual(response.context['grand_total'](), Decimal('20.00') + response.context['delivery']())
+        self.assertContains(response, f"${response.context['grand_total']():.2f}")
+
+    def test_other_pages_show_the_session_total_without_queries(self):
+        grand_total = self.client.get(reverse('view_bag')).context['grand_total']()
+        # Warm the navigation's category stats cache, then drop the bag
+        # snapshots so pricing the bag would need the database
+        self.client.get(reverse('home'))
+        bump_price_version()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, f'${grand_total:.2f}')
+
+
+class BagPayloadTests(TestCase):
+
+    def test_legacy_session_is_migrated_to_v2_once(self):
+        session = {'bag': {'1': 2, '7': {'items_by_size': {'s': 1, 'xl': 3}}}}
+        bag = Bag.from_session(session)
+
+        self.assertEqual(bag.count, 6)
+        self.assertEqual(bag.quantity(1), 2)
+        self.assertEqual(bag.quantity(7, 's'), 1)
+        self.assertEqual(bag.quantity(7, 'xl'), 3)
+        self.assertEqual(session['bag']['v'], Bag.VERSION)
+        self.assertCountEqual(session['bag']['l'], [[1, None, 2], [7, 's', 1], [7, 'xl', 3]])
+
+        migrated = session['bag']
+        self.assertEqual(Bag.from_session(session).digest(), bag.digest())
+        self.assertIs(session['bag'], migrated)
+
+    def test_round_trip_and_line_changes(self):
+        bag = Bag()
+        bag.add('3', 2)
+        bag.add(3, 1)
+        bag.set(4, 5, 'm')
+        bag.set(4, 0, 'm')
+        self.assertEqual(Bag.from_payload(bag.to_payload()).to_payload(), {'v': 2, 'l': [[3, None, 3]]})
+        self.assertEqual(bag.count, 3)
+        with self.assertRaises(KeyError):
+            bag.remove(4, 'm')
+        with self.assertRaises(ValueError):
+            bag.add(3, 0)
+
+    def test_non_positive_lines_in_a_payload_are_dropped(self):
+        bag = Bag.from_payload({'v': 2, 'l': [[1, None, 0], [2, 's', -1], [3, None, 2]]})
+        self.assertEqual(bag.to_payload(), {'v': 2, 'l': [[3, None, 2]]})
+
+    def test_adding_a_non_positive_quantity_is_rejected(self):
+        product = Product.objects.create(name='Sock', description='', price=Decimal('2.00'))
+        for quantity in ('0', '-2', 'many'):
+            response = self.client.post(reverse('add_to_bag', args=[product.pk]),
+                                        {'quantity': quantity, 'redirect_url': reverse('home')})
+            self.assertRedirects(response, reverse('home'))
+        self.assertNotIn('bag', self.client.session)
@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, reverse, HttpResponse, get_object
 from django.contrib import messages
 
 from products.models import Product
+from .bag import Bag
 
 # Create your views here.
 
@@ -16,33 +17,33 @@ def add_to_bag(request, item_id):
 
     product = get_object_or_404(Product, pk=item_id)
 
-    quantity = int(request.POST.get('quantity'))
     redirect_url = request.POST.get('redirect_url')
+    try:
+        quantity = int(request.POST.get('quantity'))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        messages.error(request, 'Please choose a quantity of at least 1')
+        return redirect(redirect_url)
     size = None
     if 'product_size' in request.POST:
-        size = request.POST['product_size']
-    bag = request.session.get('bag', {})
+        size = request.POST['product_size'] or None
+    bag = Bag.from_session(request.session)
 
+    existed = (item_id, size) in bag
+    new_quantity = bag.add(item_id, quantity, size)
     if size:
-        if item_id in list(bag.keys()):
-            if size in bag[item_id]['items_by_size'].keys():
-                bag[item_id]['items_by_size'][size] += quantity
-                messages.success(request, f'Updated size {size.upper()} {product.name} quantity to {bag[item_id]["items_by_size"][size]}')
-            else:
-                bag[item_id]['items_by_size'][size] = quantity
-                messages.success(request, f'Added size {size.upper()} {product.name} to your bag')
+        if existed:
+            messages.success(request, f'Updated size {size.upper()} {product.name} quantity to {new_quantity}')
         else:
-            bag[item_id] = {'items_by_size': {size: quantity}}
             messages.success(request, f'Added size {size.upper()} {product.name} to your bag')
     else:
-        if item_id in list(bag.keys()):
-            bag[item_id] += quantity
-            messages.success(request, f'Updated {product.name} quantity to {bag[item_id]}')
+        if existed:
+            messages.success(request, f'Updated {product.name} quantity to {new_quantity}')
         else:
-            bag[item_id] = quantity
             messages.success(request, f'Added {product.name} to your bag')
 
-    request.session['bag'] = bag
+    bag.save(request.session)
     return redirect(redirect_url)
 
 
@@ -54,27 +55,22 @@ def adjust_bag(request, item_id):
     quantity = int(request.POST.get('quantity'))
     size = None
     if 'product_size' in request.POST:
-        size = request.POST['product_size']
-    bag = request.session.get('bag', {})
+        size = request.POST['product_size'] or None
+    bag = Bag.from_session(request.session)
 
+    bag.set(item_id, quantity, size)
     if size:
         if quantity > 0:
-            bag[item_id]['items_by_size'][size] = quantity
-            messages.success(request, f'Updated size {size.upper()} {product.name} quantity to {bag[item_id]["items_by_size"][size]}')
+            messages.success(request, f'Updated size {size.upper()} {product.name} quantity to {quantity}')
         else:
-            del bag[item_id]['items_by_size'][size]
-            if not bag[item_id]['items_by_size']:
-                bag.pop(item_id)
             messages.success(request, f'Removed size {size.upper()} {product.name} from your bag')
     else:
         if quantity > 0:
-            bag[item_id] = quantity
-            messages.success(request, f'Updated {product.name} quantity to {bag[item_id]}')
+            messages.success(request, f'Updated {product.name} quantity to {quantity}')
         else:
-            bag.pop(item_id)
             messages.success(request, f'Removed {product.name} from your bag')
 
-    request.session['bag'] = bag
+    bag.save(request.session)
     return redirect(reverse('view_bag'))
 
 
@@ -86,19 +82,16 @@ def remove_from_bag(request, item_id):
     try:
         size = None
         if 'product_size' in request.POST:
-            size = request.POST['product_size']
-        bag = request.session.get('bag', {})
+            size = request.POST['product_size'] or None
+        bag = Bag.from_session(request.session)
 
+        bag.remove(item_id, size)
         if size:
-            del bag[item_id]['items_by_size'][size]
-            if not bag[item_id]['items_by_size']:
-                bag.pop(item_id)
             messages.success(request, f'Removed size {size.upper()} {product.name} from your bag')
         else:
-            bag.pop(item_id)
             messages.success(request, f'Removed {product.name} from your bag')
 
-        request.session['bag'] = bag
+        bag.save(request.session)
         return HttpResponse(status=200)
     
     except Exception as e:
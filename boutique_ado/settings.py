@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import sys
+import tempfile
 import dj_database_url    
 from pathlib import Path
 if os.path.isfile('env.py'):
@@ -101,6 +103,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
                 'bag.contexts.bag_contents',
+                'products.contexts.category_stats',
             ],
             'builtins': [
                 'crispy_forms.templatetags.crispy_forms_tags',
@@ -146,6 +149,38 @@ DATABASES = {
 #    }
 #}
 
+# Product search: PostgreSQL full-text search in production, a pure-Python
+# inverted index elsewhere (e.g. SQLite in development)
+if 'postgresql' in DATABASES['default']['ENGINE']:
+    PRODUCT_SEARCH_BACKEND = 'products.search.PostgresSearchBackend'
+else:
+    PRODUCT_SEARCH_BACKEND = 'products.search.InvertedIndexSearchBackend'
+
+# Cache invalidation (e.g. the catalog price version) must be seen by every
+# process serving the site. The default file cache, in the project's .cache
+# directory, is shared by the worker processes of one host only; when the
+# site runs on several hosts or dynos set CACHE_BACKEND and CACHE_LOCATION
+# to a shared cache, e.g. django.core.cache.backends.memcached.PyMemcacheCache
+# and host:port (requires pymemcache).
+FILE_CACHE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', FILE_CACHE_BACKEND),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+    }
+}
+if CACHES['default']['BACKEND'] == FILE_CACHE_BACKEND:
+    # Culling deletes entries at random, version counters included, which
+    # invalidates every listing and bag snapshot; keep it rare
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 20000}
+
+# Tests get a cache of their own, never one shared with a dev server or
+# another test run
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -188,13 +223,37 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # <-- Add this
 STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
-DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
+# Set MEDIA_STORAGE=local to keep uploads on the local filesystem under
+# MEDIA_ROOT instead of Cloudinary
+if os.environ.get('MEDIA_STORAGE') == 'local':
+    DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+else:
+    DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Where resized product images are written; see products.images
+PRODUCT_IMAGE_STORAGE = os.environ.get('PRODUCT_IMAGE_STORAGE', DEFAULT_FILE_STORAGE)
+# Set PRODUCT_IMAGE_DERIVATIVES_ON_SAVE=false to leave encoding a changed
+# image to a scheduled build_image_derivatives run instead of the request
+# that saved it
+PRODUCT_IMAGE_DERIVATIVES_ON_SAVE = os.environ.get(
+    'PRODUCT_IMAGE_DERIVATIVES_ON_SAVE', 'true').lower() != 'false'
+
+# Destination of the upload_media command; see products.media_upload.
+# FileSystemUploadBackend copies to MEDIA_UPLOAD_ROOT instead of Cloudinary
+MEDIA_UPLOAD_BACKEND = os.environ.get(
+    'MEDIA_UPLOAD_BACKEND', 'products.media_upload.CloudinaryUploadBackend')
+MEDIA_UPLOAD_ROOT = os.environ.get(
+    'MEDIA_UPLOAD_ROOT', os.path.join(tempfile.gettempdir(), 'boutique_ado_uploads'))
+
+# Prefix for Cloudinary image URLs, used by update_cloudinary_urls
+CLOUDINARY_MEDIA_BASE_URL = os.environ.get(
+    'CLOUDINARY_MEDIA_BASE_URL', 'https://res.cloudinary.com/dalw18spe/image/upload/v1/')
+
 
 # Stripe
 FREE_DELIVERY_THRESHOLD = 50
@@ -203,6 +262,9 @@ STRIPE_CURRENCY = 'usd'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET', '')
+
+# 'hex' (32 characters) or 'base32' (26 characters) order numbers
+ORDER_NUMBER_FORMAT = os.getenv('ORDER_NUMBER_FORMAT', 'hex')
 DEFAULT_FROM_EMAIL = 'izzysocial25@gmail.com'
 
 # Default primary key field type
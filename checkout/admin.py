@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderLineItem
+from .models import Order, OrderLineItem, ConfirmationEmail
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
@@ -28,4 +28,28 @@ class OrderAdmin(admin.ModelAdmin):
 
     ordering = ('-date',)
 
-admin.site.register(Order, OrderAdmin)
\ No newline at end of file
+    search_fields = ('full_name', 'email')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Also match the exact order number, through its unique index; a
+        contains search over order numbers can't use an index.
+        """
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term)
+        if search_term:
+            # From the incoming queryset, so list filters still apply
+            results |= queryset.filter(order_number=search_term.strip().upper())
+        return results, may_have_duplicates
+
+admin.site.register(Order, OrderAdmin)
+
+class ConfirmationEmailAdmin(admin.ModelAdmin):
+    list_display = ('order', 'status', 'attempts',
+                    'next_attempt_at', 'sent_at',)
+
+    list_filter = ('status',)
+
+    readonly_fields = ('order', 'created', 'sent_at', 'last_error',)
+
+admin.site.register(ConfirmationEmail, ConfirmationEmailAdmin)
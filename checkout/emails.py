@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import ConfirmationEmail
+
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 30
+# How long a worker may take to send a claimed email before another
+# worker retries it
+LEASE_SECONDS = 10 * 60
+
+
+def queue_confirmation_email(order):
+    """
+    Queue the order confirmation email. Each order gets at most one outbox
+    entry, so repeated webhook deliveries don't send duplicates.
+    """
+    ConfirmationEmail.objects.get_or_create(order=order)
+
+
+def build_confirmation_email(order, connection=None):
+    """ Render the confirmation email for an order """
+    subject = render_to_string(
+        'checkout/confirmation_emails/confirmation_email_subject.txt',
+        {'order': order}
+    )
+    body = render_to_string(
+        'checkout/confirmation_emails/confirmation_email_body.txt',
+        {'order': order, 'lineitems': order.get_snapshot()['lineitems'],
+         'contact_email': settings.DEFAULT_FROM_EMAIL})
+
+    return EmailMessage(
+        # Headers can't contain newlines
+        ' '.join(subject.split()),
+        body,
+        settings.DEFAULT_FROM_EMAIL,
+        [order.email],
+        connection=connection,
+    )
+
+
+def retry_delay(attempts):
+    """ Exponential backoff: 30s, 1m, 2m, 4m, ... """
+    return timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def claim_due_emails(batch_size, now):
+    """
+    Claim up to batch_size due emails for this worker in a short
+    transaction: each is marked as sending, with a lease until
+    now + LEASE_SECONDS, so no row lock is held while the mail server is
+    slow. Emails whose worker died mid-send are claimed again once their
+    lease expires. Returns the claimed emails' ids.
+    """
+    with transaction.atomic():
+        batch = list(
+            ConfirmationEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status__in=[ConfirmationEmail.PENDING, ConfirmationEmail.SENDING],
+                    next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        claimed = []
+        for email in batch:
+            if email.attempts >= MAX_ATTEMPTS:
+                # Its last attempt's worker died before recording a result
+                email.status = ConfirmationEmail.FAILED
+                email.last_error = 'Lease expired'
+                continue
+            email.status = ConfirmationEmail.SENDING
+            email.attempts += 1
+            email.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+            claimed.append(email.pk)
+        ConfirmationEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+    return claimed
+
+
+def send_queued_emails(batch_size=50):
+    """
+    Send up to batch_size due confirmation emails over a single mail
+    connection, outside any transaction. Failed sends are rescheduled with
+    exponential backoff and marked failed after MAX_ATTEMPTS. Returns
+    (sent, failed) counts.
+    """
+    now = timezone.now()
+    claimed = claim_due_emails(batch_size, now)
+    if not claimed:
+        return 0, 0
+
+    batch = list(
+        ConfirmationEmail.objects.select_related('order')
+        .filter(pk__in=claimed).order_by('next_attempt_at', 'pk'))
+    sent = failed = 0
+    with get_connection() as connection:
+        for email in batch:
+            try:
+                build_confirmation_email(email.order, connection).send()
+            except Exception as e:
+                failed += 1
+                email.last_error = str(e)
+                if email.attempts >= MAX_ATTEMPTS:
+                    email.status = ConfirmationEmail.FAILED
+                else:
+                    email.status = ConfirmationEmail.PENDING
+                    email.next_attempt_at = now + retry_delay(email.attempts)
+            else:
+                sent += 1
+                email.status = ConfirmationEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+
+    ConfirmationEmail.objects.bulk_update(
+        batch,
+        ['status', 'next_attempt_at', 'last_error', 'sent_at'],
+    )
+
+    return sent, failed
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.emails import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send queued order confirmation emails in batches over one mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Maximum number of emails sent per connection')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting once it is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait between polls when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = send_queued_emails(options['batch_size'])
+            except Exception as e:
+                # e.g. the mail server refused the connection; retry later
+                self.stderr.write(self.style.ERROR(f"Batch failed: {e}"))
+                sent = failed = 0
+                if not options['loop']:
+                    raise
+
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} emails, {failed} failed."))
+
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
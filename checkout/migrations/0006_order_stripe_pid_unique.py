@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+def dedupe_stripe_pids(apps, schema_editor):
+    """
+    Orders created twice for the same PaymentIntent (by both the checkout
+    view and the webhook) keep the earliest order's pid; later duplicates
+    get a suffixed pid so the unique constraint can be added without losing
+    any orders.
+    """
+    Order = apps.get_model('checkout', 'Order')
+    duplicates = (
+        Order.objects.exclude(stripe_pid='')
+        .values('stripe_pid')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+        .values_list('stripe_pid', flat=True)
+    )
+    for pid in list(duplicates):
+        orders = Order.objects.filter(stripe_pid=pid).order_by('date', 'id')
+        for index, order in enumerate(orders[1:], start=1):
+            order.stripe_pid = f'{pid}-duplicate-{index}'
+            order.save(update_fields=['stripe_pid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0005_order_user_profile'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_stripe_pids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('stripe_pid', ''), _negated=True), fields=('stripe_pid',), name='unique_order_stripe_pid'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_order_stripe_pid_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmationEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=7)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='confirmation_email', to='checkout.order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='confirmationemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='checkout_co_status_07c42c_idx'),
+        ),
+    ]
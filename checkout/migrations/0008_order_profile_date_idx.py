@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0007_confirmationemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user_profile', '-date'], name='order_profile_date_idx'),
+        ),
+    ]
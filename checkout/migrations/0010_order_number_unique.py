@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:31
+
+import uuid
+
+from django.db import migrations, models
+
+
+def dedupe_order_numbers(apps, schema_editor):
+    """
+    Give orders with a blank or repeated order number a fresh one (the
+    oldest order keeps a repeated number) so the unique index can be added.
+    """
+    Order = apps.get_model('checkout', 'Order')
+    duplicates = (
+        Order.objects.values('order_number')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+        .values_list('order_number', flat=True)
+    )
+    renumber = list(Order.objects.filter(order_number=''))
+    for order_number in list(duplicates):
+        if order_number:
+            renumber += list(Order.objects.filter(order_number=order_number).order_by('date', 'id')[1:])
+    for order in renumber:
+        order.order_number = uuid.uuid4().hex.upper()
+        order.save(update_fields=['order_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_order_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_order_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(editable=False, max_length=32, unique=True),
+        ),
+    ]
@@ -1,17 +1,25 @@
+import base64
 import uuid
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import Sum
 from django.conf import settings
+from django.utils import timezone
 
 from django_countries.fields import CountryField
 
 from products.models import Product
 from profiles.models import UserProfile
 
+from . import pricing
+
+
+# Order numbers generated before giving up on a save; see Order.save
+ORDER_NUMBER_ATTEMPTS = 3
+
 
 class Order(models.Model):
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(max_length=32, null=False, editable=False, unique=True)
     user_profile = models.ForeignKey(UserProfile, on_delete=models.SET_NULL,
                                      null=True, blank=True, related_name='orders')
     full_name = models.CharField(max_length=50, null=False, blank=False)
@@ -29,34 +37,134 @@ class Order(models.Model):
     grand_total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
     original_bag = models.TextField(null=False, blank=False, default='')
     stripe_pid = models.CharField(max_length=254, null=False, blank=False, default='')
+    # Line items as purchased, so the confirmation page and email render
+    # from the order row alone; see Order.get_snapshot
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # One order per PaymentIntent; arbitrates the race between the
+            # checkout view and the payment_intent.succeeded webhook.
+            models.UniqueConstraint(
+                fields=['stripe_pid'],
+                condition=~models.Q(stripe_pid=''),
+                name='unique_order_stripe_pid',
+            ),
+        ]
+        indexes = [
+            # A customer's order history, newest first; see profiles.views
+            models.Index(fields=['user_profile', '-date'], name='order_profile_date_idx'),
+        ]
 
     def _generate_order_number(self):
         """
-        Generate a random, unique order number using UUID
+        Generate a random, unique order number using UUID. With
+        settings.ORDER_NUMBER_FORMAT = 'base32' the same 128 random bits are
+        written as 26 characters instead of 32 hex digits, for smaller
+        index keys.
         """
-        return uuid.uuid4().hex.upper()
+        order_uuid = uuid.uuid4()
+        if settings.ORDER_NUMBER_FORMAT == 'base32':
+            return base64.b32encode(order_uuid.bytes).decode().rstrip('=')
+        return order_uuid.hex.upper()
     
     def update_total(self):
         """
         Update grand total each time a line item is added,
         accounting for delivery costs.
         """
-        self.order_total = self.lineitems.aggregate(Sum('lineitem_total'))['lineitem_total__sum'] or 0
-        if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
-            self.delivery_cost = self.order_total * settings.STANDARD_DELIVERY_PERCENTAGE / 100
-        else:
-            self.delivery_cost = 0
-        self.grand_total = self.order_total + self.delivery_cost
+        order_total = self.lineitems.aggregate(Sum('lineitem_total'))['lineitem_total__sum'] or 0
+        totals = pricing.calculate(order_total)
+        self.order_total = totals.subtotal
+        self.delivery_cost = totals.delivery
+        self.grand_total = totals.grand_total
         self.save()
+
+    def add_line_items(self, bag):
+        """
+        Create a line item for every line in the bag with a single bulk
+        insert, then update the order totals once. Products that no longer
+        exist are skipped, as the bag page skips them: by now the payment
+        has been taken, and the order must still be recorded.
+        """
+        products = Product.objects.in_bulk(bag.product_ids())
+        line_items = []
+        for line in bag:
+            product = products.get(line.item_id)
+            if product is None:
+                continue
+            line_items.append(OrderLineItem(
+                order=self,
+                product=product,
+                quantity=line.quantity,
+                product_size=line.size,
+                lineitem_total=product.price * line.quantity,
+            ))
+        OrderLineItem.objects.bulk_create(line_items)
+        self.snapshot = self.build_snapshot(line_items)
+        self.update_total()
+
+    @staticmethod
+    def build_snapshot(line_items):
+        """
+        Freeze line items, with their product's name, SKU and price at the
+        time of purchase, into JSON-serializable data
+        """
+        return {
+            'lineitems': [
+                {
+                    'product_id': item.product_id,
+                    'product_name': item.product.name,
+                    'sku': item.product.sku,
+                    'product_size': item.product_size,
+                    'quantity': item.quantity,
+                    'price': str(item.product.price),
+                    'lineitem_total': str(item.lineitem_total),
+                }
+                for item in line_items
+            ],
+        }
+
+    def refresh_snapshot(self):
+        """ Rebuild the snapshot from the stored line items, without saving """
+        self.snapshot = self.build_snapshot(
+            self.lineitems.select_related('product').order_by('pk'))
+
+    def get_snapshot(self):
+        """
+        The order's frozen line items. Orders placed before snapshots existed
+        get one built and stored on first use.
+        """
+        if self.snapshot is None:
+            self.refresh_snapshot()
+            Order.objects.filter(pk=self.pk).update(snapshot=self.snapshot)
+        return self.snapshot
     
     def save(self, *args, **kwargs):
         """
         Override the original save method to set the order number
         if it hasn't been set already.
         """
-        if not self.order_number:
+        if self.order_number:
+            super().save(*args, **kwargs)
+            return
+
+        # A random order number colliding with an existing one is
+        # vanishingly unlikely, but the unique index would reject it, so
+        # retry with a fresh number rather than lose the order.
+        for attempt in range(ORDER_NUMBER_ATTEMPTS):
             self.order_number = self._generate_order_number()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Other constraints (e.g. a duplicate stripe_pid) are the
+                # caller's to handle
+                taken = Order.objects.filter(order_number=self.order_number).exists()
+                self.order_number = ''
+                if not taken or attempt == ORDER_NUMBER_ATTEMPTS - 1:
+                    raise
 
     def __str__(self):
         return self.order_number
@@ -78,4 +186,38 @@ class OrderLineItem(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f'SKU {self.product.sku} on order {self.order.order_number}'
\ No newline at end of file
+        return f'SKU {self.product.sku} on order {self.order.order_number}'
+
+
+class ConfirmationEmail(models.Model):
+    """
+    Outbox entry for an order confirmation email. Rows are queued by the
+    webhook and sent in batches by the send_confirmation_emails command.
+    """
+    PENDING = 'pending'
+    # Claimed by a worker until next_attempt_at, when another may retry it
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='confirmation_email')
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'Confirmation for order {self.order.order_number} ({self.status})'
\ No newline at end of file
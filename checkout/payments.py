@@ -0,0 +1,44 @@
+import stripe
+from django.conf import settings
+
+from . import pricing
+
+INTENT_SESSION_KEY = 'checkout_intent'
+
+
+def get_payment_intent_secret(session, bag, grand_total):
+    """
+    Return the client secret of a PaymentIntent for the bag's grand total.
+
+    The intent is remembered in the session with the bag digest and amount
+    it was made for, so reloading the checkout page reuses it without
+    calling Stripe. If the amount has changed the existing intent is
+    modified; a new one is only created when there is none, or Stripe
+    refuses the change (e.g. the intent was already paid or cancelled).
+    """
+    amount = pricing.to_stripe_amount(grand_total)
+    intent = session.get(INTENT_SESSION_KEY)
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+
+    if intent is not None and intent['amount'] != amount:
+        try:
+            stripe.PaymentIntent.modify(intent['id'], amount=amount)
+        except stripe.InvalidRequestError:
+            intent = None
+
+    if intent is None:
+        created = stripe.PaymentIntent.create(
+            amount=amount,
+            currency=settings.STRIPE_CURRENCY,
+        )
+        intent = {'id': created.id, 'client_secret': created.client_secret}
+
+    if intent.get('amount') != amount or intent.get('bag') != bag.digest():
+        intent.update(amount=amount, bag=bag.digest())
+        session[INTENT_SESSION_KEY] = intent
+    return intent['client_secret']
+
+
+def forget_payment_intent(session):
+    """ Drop the session's intent once its order has been placed """
+    session.pop(INTENT_SESSION_KEY, None)
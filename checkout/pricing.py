@@ -0,0 +1,96 @@
+import bisect
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+Totals = namedtuple('Totals', 'subtotal delivery grand_total free_delivery_delta')
+
+
+class DeliveryRules:
+    """
+    Delivery charge as a percentage of the subtotal, by subtotal band.
+    Bands are (lower bound, percentage) pairs sorted by lower bound; the
+    band with the highest lower bound not above the subtotal applies.
+    """
+
+    def __init__(self, bands):
+        bands = sorted((Decimal(str(low)), Decimal(str(pct))) for low, pct in bands)
+        self.lower_bounds = [low for low, _ in bands]
+        self.rates = [pct / 100 for _, pct in bands]
+        # The lowest subtotal that is delivered for free, if any
+        free = [low for low, pct in bands if not pct]
+        self.free_threshold = free[0] if free else None
+
+    def delivery(self, subtotal):
+        index = bisect.bisect_right(self.lower_bounds, subtotal) - 1
+        if index < 0:
+            return ZERO
+        return (subtotal * self.rates[index]).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@lru_cache(maxsize=None)
+def get_delivery_rules():
+    """
+    The delivery rules, built once per process from
+    settings.STANDARD_DELIVERY_PERCENTAGE below
+    settings.FREE_DELIVERY_THRESHOLD and free delivery above it.
+    """
+    return DeliveryRules([
+        (0, settings.STANDARD_DELIVERY_PERCENTAGE),
+        (settings.FREE_DELIVERY_THRESHOLD, 0),
+    ])
+
+
+@receiver(setting_changed)
+def _reset_delivery_rules(setting, **kwargs):
+    if setting in ('FREE_DELIVERY_THRESHOLD', 'STANDARD_DELIVERY_PERCENTAGE'):
+        get_delivery_rules.cache_clear()
+
+
+def free_delivery_threshold():
+    return get_delivery_rules().free_threshold
+
+
+def subtotal(lines):
+    """ Sum of unit price * quantity over (unit price, quantity) pairs """
+    return sum((Decimal(price) * quantity for price, quantity in lines), ZERO)
+
+
+def calculate(order_subtotal):
+    """ Delivery and grand total for a subtotal, in exact Decimal cents """
+    order_subtotal = Decimal(order_subtotal).quantize(CENT, rounding=ROUND_HALF_UP)
+    rules = get_delivery_rules()
+    delivery = rules.delivery(order_subtotal)
+
+    free_delivery_delta = ZERO
+    if rules.free_threshold is not None and order_subtotal < rules.free_threshold:
+        free_delivery_delta = rules.free_threshold - order_subtotal
+
+    return Totals(
+        subtotal=order_subtotal,
+        delivery=delivery,
+        grand_total=order_subtotal + delivery,
+        free_delivery_delta=free_delivery_delta,
+    )
+
+
+def price_lines(lines):
+    """ Totals for (unit price, quantity) pairs """
+    return calculate(subtotal(lines))
+
+
+def to_stripe_amount(amount):
+    """ A Decimal amount as an integer number of cents, for Stripe """
+    return int((Decimal(amount) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_stripe_amount(cents):
+    """ An integer number of cents from Stripe as a Decimal amount """
+    return (Decimal(cents) / 100).quantize(CENT)
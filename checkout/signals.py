@@ -1,14 +1,67 @@
+import threading
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from .models import OrderLineItem
+from .models import Order, OrderLineItem
+
+# Per thread, and so per database connection: {connection alias: order ids
+# whose totals are stale}
+_state = threading.local()
+
+
+def _pending_order_ids(connection):
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        pending = _state.pending = {}
+    return pending.setdefault(connection.alias, set())
+
+
+def recalculate_order_totals(order_ids):
+    """
+    Recalculate each order's totals and snapshot once. Orders deleted in
+    the meantime (e.g. line items removed by a cascading order delete) are
+    skipped.
+    """
+    for order in Order.objects.filter(pk__in=order_ids):
+        order.refresh_snapshot()
+        order.update_total()
+
+
+def _flush_pending(connection):
+    order_ids = _pending_order_ids(connection)
+    if order_ids:
+        pending = set(order_ids)
+        order_ids.clear()
+        recalculate_order_totals(pending)
+
+
+def mark_order_dirty(order_id):
+    """
+    Flag an order's totals as stale. Inside a transaction the
+    recalculation is coalesced and runs once per order when it commits; in
+    autocommit mode it runs immediately, as before.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        recalculate_order_totals({order_id})
+        return
+
+    _pending_order_ids(connection).add(order_id)
+    # Every mark registers a flush: the first one to run on commit
+    # recalculates all pending orders and the rest find nothing to do. A
+    # rolled back transaction drops its callbacks, and the orders it marked
+    # are then recalculated (harmlessly) with the next commit's.
+    transaction.on_commit(lambda: _flush_pending(connection))
+
 
 @receiver(post_save, sender=OrderLineItem)
 def update_on_save(sender, instance, created, **kwargs):
     """
     Update order total on lineitem update/create
     """
-    instance.order.update_total()
+    mark_order_dirty(instance.order_id)
 
 
 @receiver(post_delete, sender=OrderLineItem)
@@ -16,4 +69,4 @@ def update_on_delete(sender, instance, **kwargs):
     """
     Update order total on lineitem delete
     """
-    instance.order.update_total()
+    mark_order_dirty(instance.order_id)
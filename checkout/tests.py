@@ -1,3 +1,554 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import stripe
+
+from bag.bag import Bag
+from products.models import Product
+
+from . import pricing
+from .emails import queue_confirmation_email, send_queued_emails, LEASE_SECONDS, MAX_ATTEMPTS
+from .models import Order, OrderLineItem, ConfirmationEmail
+from .webhook_handler import StripeWH_Handler
+
+
+def create_order(**kwargs):
+    fields = {
+        'full_name': 'Test Customer',
+        'email': 'customer@example.com',
+        'phone_number': '0123456789',
+        'country': 'GB',
+        'town_or_city': 'London',
+        'street_address1': '1 Test Street',
+    }
+    fields.update(kwargs)
+    return Order.objects.create(**fields)
+
+
+class ConfirmationEmailQueueTests(TestCase):
+
+    def test_queue_is_idempotent_per_order(self):
+        order = create_order()
+        queue_confirmation_email(order)
+        queue_confirmation_email(order)
+        self.assertEqual(ConfirmationEmail.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_worker_sends_batch_over_locmem_backend(self):
+        orders = [create_order(email=f'customer{i}@example.com') for i in range(3)]
+        for order in orders:
+            queue_confirmation_email(order)
+
+        call_command('send_confirmation_emails', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn(orders[0].order_number, mail.outbox[0].subject)
+        self.assertFalse(ConfirmationEmail.objects.exclude(status=ConfirmationEmail.SENT).exists())
+
+        # Already sent emails are not sent again
+        call_command('send_confirmation_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_send_errors_back_off_then_fail(self):
+        order = create_order(email='not an email\n')
+        queue_confirmation_email(order)
+        email = order.confirmation_email
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            ConfirmationEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            call_command('send_confirmation_emails', stdout=StringIO())
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, attempt)
+
+        self.assertEqual(email.status, ConfirmationEmail.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claimed_emails_are_leased_to_one_worker(self):
+        order = create_order()
+        queue_confirmation_email(order)
+        email = order.confirmation_email
+
+        # Another worker claimed it and is still sending
+        lease_expiry = timezone.now() + timedelta(seconds=LEASE_SECONDS)
+        ConfirmationEmail.objects.filter(pk=email.pk).update(
+            status=ConfirmationEmail.SENDING, attempts=1, next_attempt_at=lease_expiry)
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        # That worker died; once the lease expires the email is retried
+        ConfirmationEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (ConfirmationEmail.SENT, 2))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+CHECKOUT_FORM = {
+    'full_name': 'Test Customer',
+    'email': 'customer@example.com',
+    'phone_number': '0123456789',
+    'country': 'GB',
+    'postcode': '',
+    'town_or_city': 'London',
+    'street_address1': '1 Test Street',
+    'street_address2': '',
+    'county': '',
+}
+
+
+class OrderLineItemCreationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', sku=f'li{i}', description='',
+                                   price=Decimal('5.00') + i)
+            for i in range(6)
+        ]
+
+    def bag(self, size):
+        bag = Bag()
+        for product in self.products[:size]:
+            bag.add(product.id, 2)
+        return bag
+
+    def add_line_items_queries(self, bag):
+        order = create_order()
+        with CaptureQueriesContext(connection) as queries:
+            order.add_line_items(bag)
+        return order, len(queries)
+
+    def test_query_count_does_not_grow_with_the_bag(self):
+        _, one_line = self.add_line_items_queries(self.bag(1))
+        order, six_lines = self.add_line_items_queries(self.bag(6))
+        self.assertEqual(six_lines, one_line)
+        self.assertEqual(order.lineitems.count(), 6)
+        self.assertEqual(order.order_total, Decimal('90.00'))
+        self.assertEqual(order.lineitems.get(product=self.products[5]).lineitem_total, Decimal('20.00'))
+
+    def test_checkout_post_creates_every_line_item(self):
+        bag = self.bag(3)
+        bag.add(self.products[0].id, 1, 'm')
+        session = self.client.session
+        bag.save(session)
+        session.save()
+
+        response = self.client.post(
+            reverse('checkout'), dict(CHECKOUT_FORM, client_secret='pi_li_secret_x'))
+
+        order = Order.objects.get(stripe_pid='pi_li')
+        self.assertRedirects(response, reverse('checkout_success', args=[order.order_number]),
+                             fetch_redirect_response=False)
+        self.assertEqual(OrderLineItem.objects.filter(order=order).count(), 4)
+        self.assertEqual(order.order_total, Decimal('41.00'))
+
+    def test_missing_product_is_skipped(self):
+        bag = self.bag(1)
+        bag.add(99999, 1)
+        session = self.client.session
+        bag.save(session)
+        session.save()
+
+        response = self.client.post(
+            reverse('checkout'), dict(CHECKOUT_FORM, client_secret='pi_gone_secret_x'))
+        order = Order.objects.get(stripe_pid='pi_gone')
+        self.assertRedirects(response, reverse('checkout_success', args=[order.order_number]),
+                             fetch_redirect_response=False)
+        self.assertEqual([item.product for item in order.lineitems.all()], self.products[:1])
+
+class DeferredOrderTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Mug', sku='tot1', description='', price=Decimal('4.00'))
+
+    def add_line_items(self, order, count):
+        for _ in range(count):
+            OrderLineItem.objects.create(order=order, product=self.product, quantity=1)
+
+    def test_line_item_saves_recalculate_each_order_once_on_commit(self):
+        orders = [create_order(), create_order()]
+        with mock.patch.object(Order, 'update_total', autospec=True,
+                               side_effect=Order.update_total) as update_total:
+            with self.captureOnCommitCallbacks(execute=True):
+                for order in orders:
+                    self.add_line_items(order, 5)
+                self.assertEqual(update_total.call_count, 0)
+
+        self.assertCountEqual([call.args[0].pk for call in update_total.call_args_list],
+                              [order.pk for order in orders])
+        orders[0].refresh_from_db()
+        self.assertEqual(orders[0].order_total, Decimal('20.00'))
+        self.assertEqual(len(orders[0].snapshot['lineitems']), 5)
+
+    def test_rolled_back_marks_do_not_stop_later_recalculation(self):
+        order = create_order()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.add_line_items(order, 2)
+                    raise ValueError
+            except ValueError:
+                pass
+            self.add_line_items(order, 3)
+
+        order.refresh_from_db()
+        self.assertEqual(order.lineitems.count(), 3)
+        self.assertEqual(order.order_total, Decimal('12.00'))
+
+
+def payment_intent_event(pid, bag, amount, event_type='payment_intent.succeeded'):
+    """ A Stripe event for a PaymentIntent paid for the bag """
+    return stripe.Event.construct_from({
+        'id': f'evt_{pid}',
+        'type': event_type,
+        'data': {'object': {
+            'id': pid,
+            'object': 'payment_intent',
+            'metadata': {'bag': bag.to_json(), 'save_info': '', 'username': 'AnonymousUser'},
+            'charges': {'data': [{
+                'amount': pricing.to_stripe_amount(amount),
+                'billing_details': {'email': 'customer@example.com'},
+            }]},
+            'shipping': {
+                'name': 'Test Customer',
+                'phone': '0123456789',
+                'address': {'country': 'GB', 'postal_code': '', 'city': 'London',
+                            'line1': '1 Test Street', 'line2': '', 'state': ''},
+            },
+        }},
+    }, 'sk_test')
+
+
+class StripePidRaceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Lamp', sku='race1', description='', price=Decimal('30.00'))
+
+    def setUp(self):
+        self.bag = Bag()
+        self.bag.add(self.product.id, 1)
+        session = self.client.session
+        self.bag.save(session)
+        session.save()
+
+    def handle_webhook(self, pid):
+        event = payment_intent_event(pid, self.bag, Decimal('33.00'))
+        return StripeWH_Handler(None).handle_payment_intent_succeeded(event)
+
+    def post_checkout(self, pid):
+        return self.client.post(
+            reverse('checkout'), dict(CHECKOUT_FORM, client_secret=f'{pid}_secret_x'))
+
+    def test_webhook_finds_the_views_order_with_one_lookup(self):
+        self.post_checkout('pi_race1')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.handle_webhook('pi_race1')
+        self.assertContains(response, 'Verified order already in database')
+        order_selects = [q['sql'] for q in queries
+                         if q['sql'].startswith('SELECT') and 'FROM "checkout_order"' in q['sql']]
+        self.assertEqual(len(order_selects), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(ConfirmationEmail.objects.filter(order__stripe_pid='pi_race1').exists())
+
+    def test_view_arriving_after_the_webhook_reuses_its_order(self):
+        self.assertContains(self.handle_webhook('pi_race2'), 'Created order in webhook')
+        order = Order.objects.get(stripe_pid='pi_race2')
+
+        response = self.post_checkout('pi_race2')
+        self.assertRedirects(response, reverse('checkout_success', args=[order.order_number]),
+                             fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(order.lineitems.count(), 1)
+
+    def test_webhook_losing_the_insert_race_reuses_the_views_order(self):
+        self.post_checkout('pi_race3')
+        order = Order.objects.get(stripe_pid='pi_race3')
+
+        # The webhook's lookup ran before the view's order committed
+        filter_orders = Order.objects.filter
+
+        def stale_filter(*args, **kwargs):
+            if 'stripe_pid' in kwargs:
+                return Order.objects.none()
+            return filter_orders(*args, **kwargs)
+
+        with mock.patch.object(Order.objects, 'filter', side_effect=stale_filter):
+            response = self.handle_webhook('pi_race3')
+        self.assertContains(response, 'Verified order already in database')
+        self.assertEqual(list(Order.objects.all()), [order])
+        self.assertEqual(OrderLineItem.objects.count(), 1)
+
+
+@override_settings(STRIPE_WH_SECRET='whsec_test')
+class WebhookEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Rug', sku='wh1', description='', price=Decimal('60.00'))
+
+    def signature(self, payload, secret='whsec_test'):
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(),
+                             hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={signature}'
+
+    def post(self, payload, signature=None):
+        headers = {'HTTP_STRIPE_SIGNATURE': signature} if signature else {}
+        return self.client.post(reverse('webhook'), payload,
+                                content_type='application/json', **headers)
+
+    async def post_async(self, payload, signature=None):
+        # The async test client of Django 3.2 takes plain header names
+        headers = {'Stripe-Signature': signature} if signature else {}
+        return await self.async_client.post(reverse('webhook_async'), payload,
+                                            content_type='application/json', **headers)
+
+    def event_payload(self, pid, event_type='payment_intent.succeeded'):
+        bag = Bag()
+        bag.add(self.product.id, 1)
+        return json.dumps(payment_intent_event(pid, bag, Decimal('60.00'), event_type))
+
+    def test_signed_event_creates_the_order(self):
+        payload = self.event_payload('pi_wh1')
+        response = self.post(payload, self.signature(payload))
+        self.assertContains(response, 'Created order in webhook')
+        self.assertEqual(Order.objects.get(stripe_pid='pi_wh1').grand_total, Decimal('60.00'))
+
+    def test_bad_or_missing_signature_is_rejected(self):
+        payload = self.event_payload('pi_wh2')
+        self.assertEqual(self.post(payload, self.signature(payload, 'whsec_wrong')).status_code, 400)
+        self.assertEqual(self.post(payload).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    async def test_async_endpoint(self):
+        payload = self.event_payload('pi_wh3', 'payment_intent.payment_failed')
+
+        response = await self.post_async(payload, self.signature(payload))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'payment_intent.payment_failed', response.content)
+
+        response = await self.post_async(payload, self.signature(payload, 'whsec_wrong'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await self.post_async(payload)).status_code, 400)
+        self.assertEqual((await self.async_client.get(reverse('webhook_async'))).status_code, 405)
+
+
+class OrderSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Original name', sku='snap1', description='', price=Decimal('12.50'))
+        bag = Bag()
+        bag.add(self.product.id, 2, size='m')
+        self.order = create_order()
+        self.order.add_line_items(bag)
+
+    def test_confirmation_renders_prices_at_purchase_from_one_lookup(self):
+        self.product.name = 'Renamed'
+        self.product.price = Decimal('99.00')
+        self.product.save()
+
+        with self.assertNumQueries(1):
+            order = Order.objects.get(order_number=self.order.order_number)
+            lineitems = order.get_snapshot()['lineitems']
+        self.assertEqual(lineitems[0]['product_name'], 'Original name')
+        self.assertEqual(lineitems[0]['price'], '12.50')
+
+        response = self.client.get(
+            reverse('checkout_success', args=[self.order.order_number]))
+        self.assertContains(response, 'Original name - Size M')
+        self.assertContains(response, '2 @ $12.50 each')
+
+    def test_orders_without_a_snapshot_get_one_on_first_use(self):
+        Order.objects.filter(pk=self.order.pk).update(snapshot=None)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.get_snapshot()['lineitems'][0]['quantity'], 2)
+        order.refresh_from_db()
+        self.assertIsNotNone(order.snapshot)
+
+
+class OrderNumberTests(TestCase):
+
+    def test_colliding_order_number_is_regenerated(self):
+        existing = create_order()
+        numbers = iter([existing.order_number, 'A' * 32])
+        with mock.patch.object(Order, '_generate_order_number', lambda self: next(numbers)):
+            order = create_order()
+        self.assertEqual(order.order_number, 'A' * 32)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_admin_search_matches_the_order_number_within_filters(self):
+        gb_order = create_order()
+        us_order = create_order(country='US')
+        order_admin = site._registry[Order]
+
+        def search(order):
+            results, _ = order_admin.get_search_results(
+                None, Order.objects.filter(country='GB'), order.order_number.lower())
+            return list(results)
+
+        self.assertEqual(search(gb_order), [gb_order])
+        # Outside the filtered queryset, e.g. by an admin list filter
+        self.assertEqual(search(us_order), [])
+
+    @override_settings(ORDER_NUMBER_FORMAT='base32')
+    def test_base32_order_numbers_are_compact(self):
+        order = create_order()
+        self.assertEqual(len(order.order_number), 26)
+        self.assertEqual(Order.objects.get(order_number=order.order_number), order)
+
+
+class PricingTests(TestCase):
+
+    def test_delivery_below_and_at_free_threshold(self):
+        totals = pricing.price_lines([(Decimal('12.345'), 2), ('10.00', 1)])
+        self.assertEqual(totals.subtotal, Decimal('34.69'))
+        self.assertEqual(totals.delivery, Decimal('3.47'))
+        self.assertEqual(totals.grand_total, Decimal('38.16'))
+        self.assertEqual(totals.free_delivery_delta, Decimal('15.31'))
+
+        totals = pricing.calculate(Decimal('50.00'))
+        self.assertEqual((totals.delivery, totals.grand_total), (Decimal('0.00'), Decimal('50.00')))
+
+    @override_settings(FREE_DELIVERY_THRESHOLD=100, STANDARD_DELIVERY_PERCENTAGE=5)
+    def test_rules_follow_settings(self):
+        self.assertEqual(pricing.calculate(Decimal('60.00')).delivery, Decimal('3.00'))
+
+    def test_stripe_amounts_are_exact_cents(self):
+        self.assertEqual(pricing.to_stripe_amount(Decimal('38.16')), 3816)
+        self.assertEqual(pricing.to_stripe_amount(Decimal('0.285')), 29)
+        self.assertEqual(pricing.from_stripe_amount(3816), Decimal('38.16'))
+
+
+class FakePaymentIntent:
+    """ Local stand-in for stripe.PaymentIntent that records its calls """
+
+    calls = []
+    intents = {}
+
+    @classmethod
+    def reset(cls):
+        cls.calls = []
+        cls.intents = {}
+
+    @classmethod
+    def create(cls, amount, currency):
+        intent_id = f'pi_fake{len(cls.intents) + 1}'
+        intent = mock.Mock(id=intent_id, client_secret=f'{intent_id}_secret_x',
+                           amount=amount, status='requires_payment_method')
+        cls.intents[intent_id] = intent
+        cls.calls.append(('create', amount))
+        return intent
+
+    @classmethod
+    def modify(cls, intent_id, **params):
+        intent = cls.intents[intent_id]
+        if intent.status == 'succeeded':
+            raise stripe.InvalidRequestError('This PaymentIntent has already succeeded.', None)
+        cls.calls.append(('modify', params['amount']))
+        intent.amount = params['amount']
+        return intent
+
+
+@mock.patch.object(stripe, 'PaymentIntent', FakePaymentIntent)
+class PaymentIntentReuseTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        FakePaymentIntent.reset()
+        self.product = Product.objects.create(
+            name='Shirt', sku='pi1', description='', price=Decimal('20.00'))
+        self.add_to_bag(1)
+
+    def add_to_bag(self, quantity):
+        self.client.post(
+            reverse('add_to_bag', args=[self.product.id]),
+            {'quantity': quantity, 'redirect_url': '/', 'product_size': ''})
+
+    def checkout(self):
+        response = self.client.get(reverse('checkout'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['client_secret']
+
+    def test_reloads_reuse_the_intent(self):
+        first = self.checkout()
+        self.assertEqual(self.checkout(), first)
+        self.assertEqual(FakePaymentIntent.calls, [('create', 2200)])
+
+    def test_amount_change_modifies_the_intent(self):
+        first = self.checkout()
+        self.add_to_bag(2)
+        self.assertEqual(self.checkout(), first)
+        self.assertEqual(FakePaymentIntent.calls, [('create', 2200), ('modify', 6000)])
+
+    def test_submitted_intent_is_not_reused(self):
+        client_secret = self.checkout()
+        self.client.post(reverse('checkout'), dict(CHECKOUT_FORM, client_secret=client_secret))
+        self.assertNotIn('checkout_intent', self.client.session)
+
+        # Same bag and amount, but the old intent has been confirmed
+        self.assertNotEqual(self.checkout(), client_secret)
+        self.assertEqual(FakePaymentIntent.calls, [('create', 2200), ('create', 2200)])
+
+    def test_paid_intent_is_replaced(self):
+        first = self.checkout()
+        FakePaymentIntent.intents['pi_fake1'].status = 'succeeded'
+        self.add_to_bag(1)
+        self.assertNotEqual(self.checkout(), first)
+        self.assertEqual(FakePaymentIntent.calls, [('create', 2200), ('create', 4400)])
+
+
+@mock.patch.object(stripe, 'PaymentIntent', FakePaymentIntent)
+class DeletedProductCheckoutTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        FakePaymentIntent.reset()
+        self.kept = Product.objects.create(
+            name='Kept', sku='del1', description='', price=Decimal('30.00'))
+        self.deleted = Product.objects.create(
+            name='Deleted', sku='del2', description='', price=Decimal('20.00'))
+        for product in (self.kept, self.deleted):
+            self.client.post(reverse('add_to_bag', args=[product.id]),
+                             {'quantity': 1, 'redirect_url': '/', 'product_size': ''})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deleted.delete()
+
+    def test_checkout_charges_and_orders_the_remaining_products(self):
+        response = self.client.get(reverse('checkout'))
+        self.assertEqual(FakePaymentIntent.calls, [('create', 3300)])
+        self.assertEqual(self.client.session['bag']['l'], [[self.kept.id, None, 1]])
+
+        response = self.client.post(reverse('checkout'), dict(
+            CHECKOUT_FORM, client_secret=response.context['client_secret']))
+        order = Order.objects.get(stripe_pid='pi_fake1')
+        self.assertRedirects(response, reverse('checkout_success', args=[order.order_number]),
+                             fetch_redirect_response=False)
+        self.assertEqual(order.grand_total, Decimal('33.00'))
+        self.assertEqual([item.product for item in order.lineitems.all()], [self.kept])
+
+    def test_bag_of_only_deleted_products_is_empty(self):
+        self.client.post(reverse('adjust_bag', args=[self.kept.id]), {'quantity': 0})
+        response = self.client.get(reverse('checkout'))
+        self.assertRedirects(response, reverse('products'), fetch_redirect_response=False)
+        self.assertEqual(FakePaymentIntent.calls, [])
@@ -1,10 +1,11 @@
 from django.urls import path
 from . import views
-from .webhooks import webhook
+from .webhooks import webhook, webhook_async
 
 urlpatterns = [
     path('', views.checkout, name='checkout'),
     path('checkout_success/<order_number>', views.checkout_success, name='checkout_success'),
     path('cache_checkout_data/', views.cache_checkout_data, name='cache_checkout_data'),
     path('wh/', webhook, name='webhook'),
+    path('wh/async/', webhook_async, name='webhook_async'),
 ]
@@ -2,16 +2,17 @@ from django.shortcuts import render, redirect, reverse, get_object_or_404, HttpR
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.conf import settings
+from django.db import IntegrityError, transaction
 
 from .forms import OrderForm
-from .models import Order, OrderLineItem
-from products.models import Product
+from .models import Order
+from .payments import forget_payment_intent, get_payment_intent_secret
 from profiles.forms import UserProfileForm
 from profiles.models import UserProfile
-from bag.contexts import bag_contents
+from bag.bag import Bag
+from bag.contexts import get_bag_contents
 
 import stripe
-import json
 
 
 @require_POST
@@ -20,7 +21,7 @@ def cache_checkout_data(request):
         pid = request.POST.get('client_secret').split('_secret')[0]
         stripe.api_key = settings.STRIPE_SECRET_KEY
         stripe.PaymentIntent.modify(pid, metadata={
-            'bag': json.dumps(request.session.get('bag', {})),
+            'bag': Bag.from_session(request.session).to_json(),
             'save_info': request.POST.get('save_info'),
             'username': request.user,
         })
@@ -33,10 +34,12 @@ def cache_checkout_data(request):
 
 def checkout(request):
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
 
     if request.method == 'POST':
-        bag = request.session.get('bag', {})
+        bag = Bag.from_session(request.session)
+        # Stripe.js has confirmed the session's intent before posting the
+        # form, so it can't be paid again whatever happens to the order
+        forget_payment_intent(request.session)
 
         form_data = {
             'full_name': request.POST['full_name'],
@@ -54,34 +57,14 @@ def checkout(request):
             order = order_form.save(commit=False)
             pid = request.POST.get('client_secret').split('_secret')[0]
             order.stripe_pid = pid
-            order.original_bag = json.dumps(bag)
-            order.save()
-            for item_id, item_data in bag.items():
-                try:
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        for size, quantity in item_data['items_by_size'].items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
-                except Product.DoesNotExist:
-                    messages.error(request, (
-                        "One of the products in your bag wasn't found in our database. "
-                        "Please call us for assistance!")
-                    )
-                    order.delete()
-                    return redirect(reverse('view_bag'))
+            order.original_bag = bag.to_json()
+            try:
+                with transaction.atomic():
+                    order.save()
+                    order.add_line_items(bag)
+            except IntegrityError:
+                # The webhook already created the order for this payment
+                order = get_object_or_404(Order, stripe_pid=pid)
 
             request.session['save_info'] = 'save-info' in request.POST
             return redirect(reverse('checkout_success', args=[order.order_number]))
@@ -89,19 +72,14 @@ def checkout(request):
             messages.error(request, 'There was an error with your form. \
                 Please double check your information.')
     else:
-        bag = request.session.get('bag', {})
-        if not bag:
+        # Pricing the bag drops products that no longer exist from it
+        current_bag = get_bag_contents(request)
+        if not current_bag.bag_items:
             messages.error(request, "There's nothing in your bag at the moment")
             return redirect(reverse('products'))
 
-        current_bag = bag_contents(request)
-        total = current_bag['grand_total']
-        stripe_total = round(total * 100)
-        stripe.api_key = stripe_secret_key
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-        )
+        client_secret = get_payment_intent_secret(
+            request.session, current_bag.bag, current_bag.grand_total)
 
         if request.user.is_authenticated:
             try:
@@ -132,7 +110,7 @@ def checkout(request):
         context = {
             'order_form': order_form,
             'stripe_public_key': stripe_public_key,
-            'client_secret': intent.client_secret,
+            'client_secret': client_secret,
         }
 
         return render(request, template, context)
@@ -149,8 +127,9 @@ def checkout_success(request, order_number):
     if request.user.is_authenticated:
         profile = UserProfile.objects.get(user=request.user)
         # Attach the user's profile to the order
-        order.user_profile = profile
-        order.save()
+        if order.user_profile_id != profile.pk:
+            order.user_profile = profile
+            order.save(update_fields=['user_profile'])
 
         # Save the user's info
         if save_info:
@@ -167,36 +146,18 @@ def checkout_success(request, order_number):
             if user_profile_form.is_valid():
                 user_profile_form.save()
 
-    profile = UserProfile.objects.get(user=request.user)
-    #attach the user's profile to the order
-    order.user_profile = profile
-    order.save()
-
-    #save the user's info
-    if save_info:
-        profile_data = {
-            'default_phone_number': order.phone_number,
-            'default_country': order.country,
-            'default_postcode': order.postcode,
-            'default_town_or_city': order.town_or_city,
-            'default_street_address1': order.street_address1,
-            'default_street_address2': order.street_address2,
-            'default_county': order.county,
-        }
-        user_profile_form = UserProfileForm(profile_data, instance=profile)
-        if user_profile_form.is_valid():
-            user_profile_form.save()
-    
     messages.success(request, f'Order successfully processed! \
         Your order number is {order_number}. A confirmation \
         email will be sent to {order.email}.')
 
     if 'bag' in request.session:
         del request.session['bag']
+    forget_payment_intent(request.session)
 
     template = 'checkout/checkout_success.html'
     context = {
         'order': order,
+        'lineitems': order.get_snapshot()['lineitems'],
     }
 
-    return render(request, template, context)
\ No newline at end of file
+    return render(request, template, context)
@@ -1,16 +1,15 @@
 # Import necessary Django modules and models
 from django.http import HttpResponse
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
+from django.db import IntegrityError, transaction
 
 # Import app-specific models
-from .models import Order, OrderLineItem
-from products.models import Product
+from . import pricing
+from .emails import queue_confirmation_email
+from .models import Order
 from profiles.models import UserProfile
+from bag.bag import Bag
 
 import json
-import time
 
 class StripeWH_Handler:
     """Class to handle Stripe webhooks"""
@@ -20,25 +19,11 @@ class StripeWH_Handler:
         self.request = request
         
     def _send_confirmation_email(self, order):
-        """Send order confirmation email to the customer"""
-        cust_email = order.email
-
-        # Render email subject and body from templates using the order context
-        subject = render_to_string(
-            'checkout/confirmation_emails/confirmation_email_subject.txt',
-            {'order': order}
-        )
-        body = render_to_string(
-            'checkout/confirmation_emails/confirmation_email_body.txt',
-            {'order': order, 'contact_email': settings.DEFAULT_FROM_EMAIL})
-
-        # Send the email
-        send_mail(
-            subject,
-            body,
-            settings.DEFAULT_FROM_EMAIL,
-            [cust_email]
-        )
+        """
+        Queue the order confirmation email; the send_confirmation_emails
+        worker delivers it outside the webhook request
+        """
+        queue_confirmation_email(order)
     
     def handle_event(self, event):
         """
@@ -59,7 +44,7 @@ class StripeWH_Handler:
 
         billing_details = intent.charges.data[0].billing_details
         shipping_details = intent.shipping
-        grand_total = round(intent.data.charges[0].amount / 100, 2)  # Convert cents to dollars
+        grand_total = pricing.from_stripe_amount(intent.charges.data[0].amount)  # Convert cents to dollars
 
         # Clean up shipping details by replacing empty strings with None
         for field, value in shipping_details.address.items():
@@ -81,43 +66,19 @@ class StripeWH_Handler:
                 profile.default_county = shipping_details.address.state
                 profile.save()
                    
-        # Attempt to find if the order already exists in the database (retry up to 5 times)
-        order_exists = False
-        attempt = 1
-        while attempt <= 5:
-            try:
-                order = Order.objects.get(
-                    full_name__iexact=shipping_details.name,
-                    email__iexact=billing_details.email,
-                    phone_number__iexact=shipping_details.phone,
-                    country__iexact=shipping_details.address.country,
-                    postcode__iexact=shipping_details.address.postal_code,
-                    town_or_city__iexact=shipping_details.address.city,
-                    street_address1__iexact=shipping_details.address.line1,
-                    street_address2__iexact=shipping_details.address.line2,
-                    county__iexact=shipping_details.address.state,
-                    grand_total=grand_total,
-                    original_bag=bag,
-                    stripe_pid=pid,
-                )
-                order_exists = True
-                break
-            except Order.DoesNotExist:
-                attempt += 1
-                time.sleep(1)  # Wait before retrying (in case of DB latency)
-
-        # If order is found, send confirmation email
-        if order_exists:
+        # The checkout view normally creates the order first; stripe_pid is
+        # unique and indexed, so a single lookup tells us whether it has.
+        order = Order.objects.filter(stripe_pid=pid).first()
+        if order is not None:
             self._send_confirmation_email(order)
             return HttpResponse(
                 content=f'Webhook received: {event["type"]} | SUCCESS: Verified order already in database',
                 status=200)
 
         # Otherwise, create the order and associated line items
-        else:
-            order = None
-            try:
-                # Create a new Order object
+        try:
+            # Create a new Order object
+            with transaction.atomic():
                 order = Order.objects.create(
                     full_name=shipping_details.name,
                     user_profile=profile,
@@ -134,35 +95,23 @@ class StripeWH_Handler:
                     stripe_pid=pid,
                 )
 
-                # Create OrderLineItems from the bag contents
-                for item_id, item_data in json.loads(bag).items():
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        # Item has no size
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        # Item has sizes
-                        for size, quantity in item_data['items_by_size'].items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
+                # Create OrderLineItems from the bag contents in one insert
+                order.add_line_items(Bag.from_payload(json.loads(bag)))
 
-            # If order creation fails, delete any partial order and return error
-            except Exception as e:
-                if order:
-                    order.delete()
-                return HttpResponse(
-                    content=f'Webhook received: {event["type"]} | ERROR: {e}',
-                    status=500)
+        # The checkout view committed the same order while we were creating
+        # ours; the unique stripe_pid constraint rejected the duplicate
+        except IntegrityError:
+            order = Order.objects.get(stripe_pid=pid)
+            self._send_confirmation_email(order)
+            return HttpResponse(
+                content=f'Webhook received: {event["type"]} | SUCCESS: Verified order already in database',
+                status=200)
+
+        # If order creation fails the transaction is rolled back; return error
+        except Exception as e:
+            return HttpResponse(
+                content=f'Webhook received: {event["type"]} | ERROR: {e}',
+                status=500)
 
         # Send confirmation email for the newly created order
         self._send_confirmation_email(order)
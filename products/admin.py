@@ -19,6 +19,10 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = (
         'friendly_name',
         'name',
+        'product_count',
+        'min_price',
+        'max_price',
+        'avg_rating',
     )
 
 admin.site.register(Product, ProductAdmin)
@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+
+PRICE_VERSION_KEY = 'products:price_version'
+CATALOG_GENERATION_KEY = 'products:catalog_generation'
+
+
+def _get_counter(key):
+    """
+    Read a version counter. If it has been evicted it is reseeded from the
+    clock so it can never fall back to a value already used.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def _bump_counter(key):
+    """
+    Move a version counter to a value never used before. Not every cache
+    backend has an atomic incr (the file cache reads and rewrites the
+    value), and two concurrent increments could both write the same new
+    value, so each bump writes its own clock reading instead.
+    """
+    cache.set(key, max(time.time_ns(), _get_counter(key) + 1), timeout=None)
+
+
+def get_price_version():
+    """
+    Return the current catalog price version, used to key anything cached
+    from product prices.
+    """
+    return _get_counter(PRICE_VERSION_KEY)
+
+
+def bump_price_version():
+    """ Invalidate everything cached against the current price version """
+    _bump_counter(PRICE_VERSION_KEY)
+
+
+def get_catalog_generation():
+    """
+    Return the catalog generation, used to key rendered product listings.
+    It moves whenever a product or category changes.
+    """
+    return _get_counter(CATALOG_GENERATION_KEY)
+
+
+def bump_catalog_generation():
+    """ Invalidate every cached product listing """
+    _bump_counter(CATALOG_GENERATION_KEY)
@@ -0,0 +1,275 @@
+import csv
+import json
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import reset_queries, transaction
+
+from .catalog import bump_catalog_generation, bump_price_version
+from .category_stats import refresh_category_stats
+from .models import Category, Product
+from .search import get_search_backend
+
+# Columns of an exported catalog, in order. category is the category name.
+CATALOG_FIELDS = (
+    'sku', 'name', 'description', 'price', 'rating', 'category',
+    'has_sizes', 'image_url', 'image',
+)
+# Product fields an import writes to existing products
+UPDATE_FIELDS = (
+    'name', 'description', 'price', 'rating', 'category_id',
+    'has_sizes', 'image_url', 'image',
+)
+# Errors beyond this many are counted but not kept
+MAX_REPORTED_ERRORS = 50
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def catalog_format(path, fmt=None):
+    """ 'csv', 'json' or 'jsonl', from fmt or the file extension """
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    if fmt not in ('csv', 'json', 'jsonl'):
+        raise ValueError(f"Unknown catalog format '{fmt}', use csv, json or jsonl")
+    return fmt
+
+
+def iter_json_values(f):
+    """
+    Yield the values of a JSON array, or of whitespace separated JSON
+    values (JSON Lines), one at a time while reading the file in chunks,
+    so the whole document is never held in memory. Numbers with a
+    fraction are read as Decimal, exactly as written.
+    """
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    buffer = ''
+    position = 0
+    eof = False
+    # Only the outermost array's brackets are punctuation; a nested array
+    # is a value of its own
+    started = False
+    while True:
+        # Skip whitespace and the array punctuation between values
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            if buffer[position] == '[' and started:
+                break
+            started = started or not buffer[position].isspace()
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = f.read(READ_CHUNK_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The value continues in the next chunk
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield value
+        position = end
+        started = True
+
+
+def read_catalog(f, fmt):
+    """
+    Yield catalog records as dicts from an open text file. Django fixture
+    entries ({"model": ..., "fields": {...}}) are unwrapped.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield {key: (value if value != '' else None) for key, value in row.items()}
+        return
+    for value in iter_json_values(f):
+        # Anything that isn't an object is left for the importer to reject
+        yield value.get('fields', value) if isinstance(value, dict) else value
+
+
+def _export_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def write_catalog(f, fmt, records):
+    """ Write catalog records to an open text file as they are produced """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            count += 1
+        return count
+
+    if fmt == 'json':
+        f.write('[')
+    for record in records:
+        if fmt == 'json':
+            f.write(',\n' if count else '\n')
+        f.write(json.dumps({k: _export_value(v) for k, v in record.items()}))
+        if fmt == 'jsonl':
+            f.write('\n')
+        count += 1
+    if fmt == 'json':
+        f.write('\n]\n')
+    return count
+
+
+def export_records(chunk_size=2000):
+    """ Every product as a catalog record, streamed from the database """
+    rows = (
+        Product.objects.order_by('pk')
+        .values_list(*[f if f != 'category' else 'category__name' for f in CATALOG_FIELDS])
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield dict(zip(CATALOG_FIELDS, row))
+
+
+class CatalogImporter:
+    """
+    Upserts catalog records by sku in batches: one query to find the
+    existing products of a batch, then one transaction that updates the
+    changed ones and bulk creates the new ones. Categories are resolved by
+    name (or fixture pk) from a map loaded once, and created when missing.
+
+    Bulk writes send no model signals, so finish() recomputes the category
+    aggregates, rebuilds the search index and invalidates cached listings.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.created = self.updated = self.unchanged = self.skipped = 0
+        self.errors = []
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.category_ids = set(self.categories.values())
+
+    def _category_id(self, value):
+        """
+        The category id for a record's category: an integer is a category
+        pk (as in fixtures), anything else a name, created when missing
+        """
+        if value is None or value == '':
+            return None
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value in self.category_ids:
+                return value
+            raise ValidationError(f'Unknown category id {value}')
+        value = str(value)
+        if value not in self.categories:
+            category = Category.objects.create(name=value, friendly_name=value.replace('_', ' ').title())
+            self.categories[value] = category.pk
+            self.category_ids.add(category.pk)
+        return self.categories[value]
+
+    def _product(self, record):
+        """
+        An unsaved Product for the record, with every value validated as a
+        model field (max_length, max_digits, ...) so a bad row is skipped
+        rather than failing its whole batch in the database. Raises
+        ValidationError.
+        """
+        values = {}
+        for field in CATALOG_FIELDS:
+            value = record.get(field)
+            if field == 'category':
+                values['category_id'] = self._category_id(value)
+            elif field == 'has_sizes' and isinstance(value, str):
+                values[field] = value.lower() in ('1', 'true', 'yes')
+            elif field == 'description' and value in (None, ''):
+                values[field] = ''
+            else:
+                try:
+                    value = Product._meta.get_field(field).clean(value, None)
+                except ValidationError as e:
+                    raise ValidationError([f'{field}: {message}' for message in e.messages])
+                if field == 'image':
+                    # Stored as '' when empty, as a save would
+                    value = value or ''
+                values[field] = value
+        return Product(**values)
+
+    def _flush(self, batch):
+        existing = {
+            row[0]: row[1:]
+            for row in Product.objects.filter(sku__in=batch.keys())
+            .values_list('sku', 'pk', *UPDATE_FIELDS)
+        }
+        to_update, to_create = [], []
+        for sku, product in batch.items():
+            if sku not in existing:
+                to_create.append(product)
+                continue
+            pk, *stored = existing[sku]
+            product.pk = pk
+            # Re-importing an unchanged catalog should not rewrite every row
+            if [getattr(product, field) for field in UPDATE_FIELDS] == stored:
+                self.unchanged += 1
+            else:
+                to_update.append(product)
+        with transaction.atomic():
+            # One plain UPDATE per changed row: bulk_update's CASE
+            # expressions cost several times more to build than these
+            for product in to_update:
+                Product.objects.filter(pk=product.pk).update(
+                    **{field: getattr(product, field) for field in UPDATE_FIELDS})
+            Product.objects.bulk_create(to_create)
+        self.updated += len(to_update)
+        self.created += len(to_create)
+        # With DEBUG on every query is logged; keep memory flat over the import
+        reset_queries()
+
+    def _skip(self, number, reason):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((number, reason))
+
+    def run(self, records, progress=None):
+        """
+        Import every record. progress, if given, is called with the number
+        of rows read so far after each batch.
+        """
+        batch = {}
+        rows = 0
+        for number, record in enumerate(records, 1):
+            rows = number
+            if not isinstance(record, dict):
+                self._skip(number, 'not an object')
+                continue
+            sku = record.get('sku')
+            if not sku:
+                self._skip(number, 'missing sku')
+                continue
+            try:
+                product = self._product(record)
+            except ValidationError as e:
+                self._skip(number, '; '.join(e.messages))
+                continue
+            # A sku repeated within a batch keeps its last record
+            batch[product.sku] = product
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = {}
+                if progress:
+                    progress(rows)
+        if batch:
+            self._flush(batch)
+        return rows
+
+    def finish(self):
+        refresh_category_stats()
+        get_search_backend().rebuild()
+        bump_price_version()
+        bump_catalog_generation()
+
+
+def rate(rows, started):
+    """ Rows per second since the time.monotonic() value started """
+    return rows / max(time.monotonic() - started, 1e-6)
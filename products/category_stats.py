@@ -0,0 +1,99 @@
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+
+from .models import Category, Product
+
+
+def _rating_delta(rating, sign):
+    if rating is None:
+        return {}
+    return {
+        'rating_sum': F('rating_sum') + sign * rating,
+        'rating_count': F('rating_count') + sign,
+    }
+
+
+def product_added(category_id, price, rating):
+    """ Fold a new product into its category's aggregates """
+    if category_id is None:
+        return
+    # Cast so SQLite compares the bound parameter as a number, not text
+    price = Cast(Value(price), Category._meta.get_field('min_price'))
+    Category.objects.filter(pk=category_id).update(
+        product_count=F('product_count') + 1,
+        min_price=Least(Coalesce('min_price', price), price),
+        max_price=Greatest(Coalesce('max_price', price), price),
+        **_rating_delta(rating, 1),
+    )
+
+
+def product_removed(category_id, price, rating):
+    """
+    Take a product out of its category's aggregates. Only if it held the
+    category's minimum or maximum price are the bounds re-read.
+    """
+    if category_id is None:
+        return
+    Category.objects.filter(pk=category_id).update(
+        product_count=F('product_count') - 1,
+        **_rating_delta(rating, -1),
+    )
+    holds_bound = Category.objects.filter(
+        Q(min_price=price) | Q(max_price=price), pk=category_id).exists()
+    if holds_bound:
+        refresh_price_range(category_id)
+
+
+def product_changed(old, new):
+    """
+    Update aggregates for an edited product. old and new are
+    (category_id, price, rating) tuples.
+    """
+    if old == new:
+        return
+    old_category, old_price, old_rating = old
+    new_category, new_price, new_rating = new
+    if old_category != new_category or old_price != new_price:
+        product_removed(*old)
+        product_added(*new)
+    elif old_rating != new_rating and new_category is not None:
+        Category.objects.filter(pk=new_category).update(
+            rating_sum=F('rating_sum') + ((new_rating or 0) - (old_rating or 0)),
+            rating_count=F('rating_count') + (int(new_rating is not None) - int(old_rating is not None)),
+        )
+
+
+def refresh_price_range(category_id):
+    bounds = Product.objects.filter(category_id=category_id).aggregate(
+        min_price=Min('price'), max_price=Max('price'))
+    Category.objects.filter(pk=category_id).update(**bounds)
+
+
+def refresh_category_stats(category_ids=None):
+    """
+    Recompute every aggregate from the product table, for the given
+    categories or all of them. Use after bulk changes that bypass signals.
+    """
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    categories = list(categories)
+    stats = {
+        row['category']: row
+        for row in Product.objects.filter(category__in=categories)
+        .values('category')
+        .annotate(
+            product_count=Count('pk'),
+            min_price=Min('price'),
+            max_price=Max('price'),
+            rating_sum=Coalesce(Sum('rating'), Value(0), output_field=Category._meta.get_field('rating_sum')),
+            rating_count=Count('rating'),
+        )
+    }
+    empty = {'product_count': 0, 'min_price': None, 'max_price': None,
+             'rating_sum': 0, 'rating_count': 0}
+    for category in categories:
+        row = stats.get(category.pk, empty)
+        for field in empty:
+            setattr(category, field, row[field])
+    Category.objects.bulk_update(categories, list(empty))
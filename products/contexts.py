@@ -0,0 +1,32 @@
+from django.core.cache import cache
+
+from .catalog import get_catalog_generation
+from .models import Category
+
+
+def get_category_stats():
+    """
+    {category name: Category} with the maintained aggregates, cached until
+    the catalog generation moves
+    """
+    key = f'products:category_stats:{get_catalog_generation()}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = {category.name: category for category in Category.objects.all()}
+        cache.set(key, stats, 60 * 60 * 24)
+    return stats
+
+
+def category_stats(request):
+    """
+    Context processor exposing per-category counts and price ranges to the
+    navigation. Resolved at most once per request, and only if used.
+    """
+    stats = []
+
+    def resolve():
+        if not stats:
+            stats.append(get_category_stats())
+        return stats[0]
+
+    return {'category_stats': resolve}
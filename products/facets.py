@@ -0,0 +1,65 @@
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = (
+    ('under-25', 'Under $25', None, 25),
+    ('25-50', '$25 to $50', 25, 50),
+    ('50-100', '$50 to $100', 50, 100),
+    ('100-plus', '$100 and over', 100, None),
+)
+
+
+def _band_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def price_band_filter(key):
+    """ Q object for the price band with the given key, or None """
+    for band_key, _, low, high in PRICE_BANDS:
+        if band_key == key:
+            return _band_q(low, high)
+    return None
+
+
+def facet_counts(queryset):
+    """
+    Category and price band counts for the products in queryset, from a
+    single GROUP BY (category, price band) query.
+    """
+    band = Case(
+        *[When(_band_q(low, high), then=Value(index))
+          for index, (_, _, low, high) in enumerate(PRICE_BANDS)],
+        output_field=IntegerField(),
+    )
+    rows = (
+        queryset.order_by()
+        .values('category__name', 'category__friendly_name', band=band)
+        .annotate(count=Count('pk'))
+    )
+
+    categories = {}
+    band_counts = [0] * len(PRICE_BANDS)
+    for row in rows:
+        if row['category__name'] is not None:
+            category = categories.setdefault(row['category__name'], {
+                'name': row['category__name'],
+                'friendly_name': row['category__friendly_name'],
+                'count': 0,
+            })
+            category['count'] += row['count']
+        if row['band'] is not None:
+            band_counts[row['band']] += row['count']
+
+    return {
+        'categories': sorted(categories.values(), key=lambda c: c['friendly_name'] or c['name']),
+        'price_bands': [
+            {'key': key, 'label': label, 'count': count}
+            for (key, label, _, _), count in zip(PRICE_BANDS, band_counts)
+            if count
+        ],
+    }
@@ -0,0 +1,160 @@
+import hashlib
+import io
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+from PIL import Image, ImageOps
+
+# (name, maximum width in pixels). Originals are never upscaled, so a small
+# original yields fewer derivatives.
+DERIVATIVE_SIZES = (
+    ('thumb', 160),
+    ('card', 400),
+    ('detail', 1000),
+)
+
+# (file extension, Pillow format, save options)
+DERIVATIVE_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 6}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# Part of the content hash: bump it to regenerate every derivative after
+# changing the sizes, formats or encoder options above
+PIPELINE_VERSION = 1
+
+DERIVATIVES_DIR = 'derivatives'
+REMOTE_FETCH_TIMEOUT = 10
+
+# What Pillow raises for data it can't or won't decode, besides OSError;
+# DecompressionBombError is raised for images over twice MAX_IMAGE_PIXELS
+IMAGE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+# EXIF orientations that swap width and height once the image is upright
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+@lru_cache(maxsize=None)
+def _storage(import_path):
+    return get_storage_class(import_path)()
+
+
+def get_derivative_storage():
+    """ The storage selected by settings.PRODUCT_IMAGE_STORAGE """
+    return _storage(settings.PRODUCT_IMAGE_STORAGE)
+
+
+def content_hash(data):
+    """ Hash of the original image bytes and the pipeline version """
+    digest = hashlib.sha256(f'v{PIPELINE_VERSION}:'.encode())
+    digest.update(data)
+    return digest.hexdigest()[:20]
+
+
+def _encode(image, width, height, image_format, options):
+    resized = image.resize((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = io.BytesIO()
+    resized.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_derivatives(data):
+    """
+    Write the resized copies of the original image bytes to the derivative
+    storage and return their manifest:
+
+        {'hash': ..., 'sizes': [{'name': 'card', 'width': 400,
+                                 'height': 400, 'webp': path, 'jpg': path}]}
+
+    File names are derived from the content hash, so derivatives that
+    already exist in storage are reused rather than encoded again.
+    Raises one of IMAGE_ERRORS if the data is not an image Pillow can read.
+    """
+    storage = get_derivative_storage()
+    source_hash = content_hash(data)
+    image = None
+    with Image.open(io.BytesIO(data)) as original:
+        original_size = original.size
+        if original.getexif().get(EXIF_ORIENTATION, 1) in ROTATED_ORIENTATIONS:
+            original_size = original_size[::-1]
+
+        sizes = []
+        for name, max_width in DERIVATIVE_SIZES:
+            width = min(max_width, original_size[0])
+            if sizes and sizes[-1]['width'] == width:
+                continue
+            height = max(1, round(original_size[1] * width / original_size[0]))
+            derivative = {'name': name, 'width': width, 'height': height}
+            for extension, image_format, options in DERIVATIVE_FORMATS:
+                path = f'{DERIVATIVES_DIR}/{source_hash[:2]}/{source_hash}/{name}-{width}.{extension}'
+                if not storage.exists(path):
+                    if image is None:
+                        image = ImageOps.exif_transpose(original)
+                        image.load()
+                    path = storage.save(path, ContentFile(
+                        _encode(image, width, height, image_format, options)))
+                derivative[extension] = path
+            sizes.append(derivative)
+
+    return {'hash': source_hash, 'sizes': sizes}
+
+
+def read_original(product, fetch_remote=False):
+    """
+    The original image bytes of a product: the uploaded image file, or with
+    fetch_remote the image at image_url. Returns None if there is neither.
+    """
+    if product.image:
+        with product.image.open('rb') as image_file:
+            return image_file.read()
+    if fetch_remote and product.image_url:
+        response = requests.get(product.image_url, timeout=REMOTE_FETCH_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    return None
+
+
+def generate_product_derivatives(product, fetch_remote=False):
+    """
+    Build the derivatives of a product's image and store their manifest on
+    the product. Returns the manifest, or None if the product has no image.
+    """
+    data = read_original(product, fetch_remote=fetch_remote)
+    manifest = build_derivatives(data) if data else None
+    product.image_derivatives = manifest
+    type(product).objects.filter(pk=product.pk).update(image_derivatives=manifest)
+    return manifest
+
+
+def derivative_url(path):
+    return get_derivative_storage().url(path)
+
+
+def derivative_srcsets(manifest):
+    """
+    Map each derivative format to its srcset attribute value for the
+    manifest, e.g. {'webp': 'a.webp 160w, b.webp 400w', 'jpg': ...}
+    """
+    return {
+        extension: ', '.join(
+            f"{derivative_url(size[extension])} {size['width']}w"
+            for size in manifest['sizes'])
+        for extension, _, _ in DERIVATIVE_FORMATS
+    }
+
+
+def derivative_for(manifest, name):
+    """
+    The named derivative from the manifest, or the largest one below it
+    when the original was too small to produce it.
+    """
+    order = [size_name for size_name, _ in DERIVATIVE_SIZES]
+    wanted = order.index(name)
+    candidates = [size for size in manifest['sizes'] if order.index(size['name']) <= wanted]
+    return candidates[-1] if candidates else manifest['sizes'][0]
@@ -0,0 +1,19 @@
+from .models import Product
+
+# Most SKUs the lookup endpoint resolves per request
+MAX_SKUS_PER_LOOKUP = 100
+
+
+def get_products_by_sku(skus, queryset=None):
+    """
+    {sku: product} for the given SKUs, fetched with a single query on the
+    unique SKU index. SKUs without a product are left out.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    return queryset.in_bulk(set(skus), field_name='sku')
+
+
+def get_product_by_sku(sku, queryset=None):
+    """ The product with the given SKU, or None """
+    return get_products_by_sku([sku], queryset).get(sku)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from products.catalog import bump_catalog_generation, bump_price_version
+from products.images import IMAGE_ERRORS, generate_product_derivatives
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Build the resized thumbnail, card and detail copies of product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild products that already have derivatives',
+        )
+        parser.add_argument(
+            '--fetch-remote', action='store_true',
+            help='Download image_url for products without an uploaded image',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.only('id', 'name', 'image', 'image_url', 'image_derivatives')
+        if not options['force']:
+            products = products.filter(image_derivatives__isnull=True)
+
+        built = skipped = failed = 0
+        for product in products.iterator():
+            try:
+                manifest = generate_product_derivatives(
+                    product, fetch_remote=options['fetch_remote'])
+            except IMAGE_ERRORS as e:
+                self.stderr.write(self.style.ERROR(f"Failed {product.name}: {e}"))
+                failed += 1
+                continue
+            if manifest is None:
+                skipped += 1
+            else:
+                built += 1
+
+        if built:
+            # Rendered listings and bag snapshots hold the old image markup
+            bump_catalog_generation()
+            bump_price_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {built} built, {skipped} without an image, {failed} failed."))
@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_io import catalog_format, export_records, rate, write_catalog
+
+
+class Command(BaseCommand):
+    help = "Export every product to a CSV, JSON or JSON Lines catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument(
+            '--format', choices=('csv', 'json', 'jsonl'),
+            help='Catalog format (default from the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Products read per query (default 2000)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = catalog_format(path, options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        started = time.monotonic()
+        records = export_records(chunk_size=options['chunk_size'])
+        if path == '-':
+            write_catalog(sys.stdout, fmt, records)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            rows = write_catalog(f, fmt, records)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {rows} products exported in {time.monotonic() - started:.1f}s "
+            f"({rate(rows, started):.0f} rows/s)."))
@@ -0,0 +1,51 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_io import CatalogImporter, catalog_format, rate, read_catalog
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV, JSON or JSON Lines catalog, upserting by sku"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file, or '-' for stdin")
+        parser.add_argument(
+            '--format', choices=('csv', 'json', 'jsonl'),
+            help='Catalog format (default from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Products written per batch (default 1000)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = catalog_format(path, options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        started = time.monotonic()
+
+        def progress(rows):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{rows} rows ({rate(rows, started):.0f} rows/s)")
+
+        f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = importer.run(read_catalog(f, fmt), progress=progress)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        importer.finish()
+
+        for number, reason in importer.errors:
+            self.stderr.write(self.style.ERROR(f"Record {number} skipped: {reason}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {rows} rows in {time.monotonic() - started:.1f}s "
+            f"({rate(rows, started):.0f} rows/s): {importer.created} created, "
+            f"{importer.updated} updated, {importer.unchanged} unchanged, "
+            f"{importer.skipped} skipped."))
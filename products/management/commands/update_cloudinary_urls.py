@@ -1,22 +1,71 @@
 import os
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from products.catalog import bump_catalog_generation, bump_price_version
 from products.models import Product
 
-CLOUDINARY_BASE = "https://res.cloudinary.com/dalw18spe/image/upload/v1/"
 
 class Command(BaseCommand):
     help = "Update product.image_url from image file paths (assuming they've been uploaded to Cloudinary)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base', default=settings.CLOUDINARY_MEDIA_BASE_URL,
+            help='URL prefix for the image file names (default settings.CLOUDINARY_MEDIA_BASE_URL)',
+        )
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='Re-point products that already have an image_url',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows read and written per query (default 1000)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the changes without saving them',
+        )
+
     def handle(self, *args, **options):
-        updated = 0
-        for product in Product.objects.all():
-            if product.image and not product.image_url:
-                filename = os.path.basename(product.image.name)
-                cloudinary_url = CLOUDINARY_BASE + filename
+        base = options['base']
+        if not base.endswith('/'):
+            base += '/'
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
 
-                product.image_url = cloudinary_url
-                product.save(update_fields=["image_url"])
-                self.stdout.write(self.style.SUCCESS(f"Updated {product.name}: {cloudinary_url}"))
-                updated += 1
+        products = Product.objects.exclude(Q(image='') | Q(image__isnull=True))
+        if not options['overwrite']:
+            products = products.filter(Q(image_url='') | Q(image_url__isnull=True))
+        products = products.only('id', 'name', 'image', 'image_url').order_by('pk')
 
+        updated = 0
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            cloudinary_url = base + os.path.basename(product.image.name)
+            if product.image_url == cloudinary_url:
+                continue
+            product.image_url = cloudinary_url
+            batch.append(product)
+            updated += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Updated {product.name}: {cloudinary_url}")
+            if len(batch) >= batch_size:
+                self._save(batch, dry_run)
+                batch = []
+        self._save(batch, dry_run)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"\nDry run. {updated} products would be updated."))
+            return
+        if updated:
+            # bulk_update bypasses the product signals
+            bump_price_version()
+            bump_catalog_generation()
         self.stdout.write(self.style.SUCCESS(f"\n✅ Done. {updated} products updated."))
+
+    def _save(self, batch, dry_run):
+        if batch and not dry_run:
+            Product.objects.bulk_update(batch, ['image_url'])
@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.images import DERIVATIVES_DIR
+from products.media_upload import UploadManifest, file_hash, get_upload_backend, media_files
+
+# Save the manifest after this many finished files so an interrupted run
+# loses little work
+SAVE_EVERY = 25
+
+
+def _upload(backend, path, name, recorded_hash, force):
+    """ Runs on a worker thread. Returns (sha256, url or None if unchanged) """
+    sha256 = file_hash(path)
+    if sha256 == recorded_hash and not force:
+        return sha256, None
+    return sha256, backend.upload(path, name)
+
+
+class Command(BaseCommand):
+    help = "Upload the media folder in parallel, skipping files already uploaded"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent uploads (default 8)',
+        )
+        parser.add_argument(
+            '--backend', default=None,
+            help='Import path of the upload backend (default settings.MEDIA_UPLOAD_BACKEND)',
+        )
+        parser.add_argument(
+            '--manifest', default=None,
+            help='Path of the upload manifest (default MEDIA_ROOT/.upload-manifest.json)',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Upload every file, even if the manifest says it is unchanged',
+        )
+
+    def handle(self, *args, **options):
+        backend_path = options['backend'] or settings.MEDIA_UPLOAD_BACKEND
+        backend = get_upload_backend(backend_path)
+        manifest = UploadManifest(
+            options['manifest'] or os.path.join(settings.MEDIA_ROOT, '.upload-manifest.json'),
+            backend_path)
+        force = options['force']
+        workers = max(1, options['workers'])
+
+        self.manifest = manifest
+        self.uploaded = self.unchanged = self.failed = self.finished = 0
+        self.uploaded_bytes = 0
+        start = time.monotonic()
+
+        in_flight = {}
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            # Derivatives are built from the originals wherever they're
+            # served from (build_image_derivatives), not copied
+            for path, name in media_files(settings.MEDIA_ROOT, exclude=(DERIVATIVES_DIR,)):
+                stat = os.stat(path)
+                if not force and manifest.is_unchanged(name, stat):
+                    self.unchanged += 1
+                    continue
+                # Keep the queue bounded instead of submitting the whole tree
+                if len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(done, in_flight)
+                future = pool.submit(
+                    _upload, backend, path, name, manifest.recorded_hash(name), force)
+                in_flight[future] = (name, stat)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                self._collect(done, in_flight)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            manifest.save()
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        megabytes = self.uploaded_bytes / (1024 * 1024)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {self.uploaded} uploaded ({megabytes:.1f} MB in {elapsed:.1f}s, "
+            f"{megabytes / elapsed:.2f} MB/s, {self.uploaded / elapsed:.1f} files/s), "
+            f"{self.unchanged} unchanged, {self.failed} failed."))
+
+    def _collect(self, done, in_flight):
+        for future in done:
+            name, stat = in_flight.pop(future)
+            try:
+                sha256, url = future.result()
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Failed to upload {name}: {e}"))
+                self.failed += 1
+                continue
+
+            self.manifest.record(name, sha256, stat, url or self.manifest.files[name]['url'])
+            if url is None:
+                self.unchanged += 1
+            else:
+                self.uploaded += 1
+                self.uploaded_bytes += stat.st_size
+                self.stdout.write(f"Uploaded {name} -> {url}")
+
+            self.finished += 1
+            if self.finished % SAVE_EVERY == 0:
+                self.manifest.save()
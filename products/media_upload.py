@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import cloudinary.uploader
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class CloudinaryUploadBackend:
+    """
+    Uploads to Cloudinary with the file's path relative to the media
+    folder as its public id, so Cloudinary URLs mirror the media folder.
+    """
+
+    def upload(self, path, name):
+        """ Upload the file at path as name and return its URL """
+        response = cloudinary.uploader.upload(
+            path, public_id=name, resource_type='image', overwrite=True)
+        return response['secure_url']
+
+
+class FileSystemUploadBackend:
+    """
+    Local stand-in for Cloudinary: copies files under
+    settings.MEDIA_UPLOAD_ROOT.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or settings.MEDIA_UPLOAD_ROOT
+
+    def upload(self, path, name):
+        destination = os.path.join(self.location, *name.split('/'))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(path, destination)
+        return 'file://' + destination
+
+
+def get_upload_backend(import_path=None):
+    """ The backend named by import_path or settings.MEDIA_UPLOAD_BACKEND """
+    return import_string(import_path or settings.MEDIA_UPLOAD_BACKEND)()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """
+    Record of uploaded files per backend, keyed by media-relative name:
+
+        {backend: {name: {'sha256': ..., 'size': ..., 'mtime': ..., 'url': ...}}}
+
+    It is saved as uploads complete, so an interrupted run resumes where
+    it stopped. Saves go through a temporary file and a rename, so a crash
+    mid-write never corrupts the manifest.
+    """
+
+    def __init__(self, path, backend):
+        self.path = path
+        self.backend = backend
+        self.data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+        self.files = self.data.setdefault(backend, {})
+
+    def is_unchanged(self, name, stat):
+        """ True if the file's size and mtime match the recorded upload """
+        entry = self.files.get(name)
+        return (entry is not None and entry['size'] == stat.st_size
+                and entry['mtime'] == stat.st_mtime_ns)
+
+    def recorded_hash(self, name):
+        entry = self.files.get(name)
+        return entry and entry['sha256']
+
+    def record(self, name, sha256, stat, url):
+        self.files[name] = {
+            'sha256': sha256, 'size': stat.st_size,
+            'mtime': stat.st_mtime_ns, 'url': url,
+        }
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def media_files(root, exclude=()):
+    """
+    (path, media-relative name) of every non-hidden file under root,
+    except in the top-level directories named in exclude
+    """
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        if directory == root:
+            dirs[:] = [d for d in dirs if d not in exclude]
+        for filename in sorted(files):
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(directory, filename)
+            yield path, os.path.relpath(path, root).replace(os.sep, '/')
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:48
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Build the GIN index and fill in the vectors on PostgreSQL. Other
+    databases use the in-process inverted index and leave the column empty.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+
+    schema_editor.execute(
+        'CREATE INDEX product_search_vector_idx '
+        'ON products_product USING gin (search_vector)'
+    )
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        search_vector=SearchVector('name', weight='A') + SearchVector('description', weight='B'))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:52
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def backfill_category_stats(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    stats = {
+        row['category']: row
+        for row in Product.objects.exclude(category=None)
+        .values('category')
+        .annotate(
+            product_count=Count('pk'),
+            min_price=Min('price'),
+            max_price=Max('price'),
+            rating_sum=Sum('rating'),
+            rating_count=Count('rating'),
+        )
+    }
+    for category in Category.objects.all():
+        row = stats.get(category.pk)
+        if row:
+            category.product_count = row['product_count']
+            category.min_price = row['min_price']
+            category.max_price = row['max_price']
+            category.rating_sum = row['rating_sum'] or 0
+            category.rating_count = row['rating_count']
+            category.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:17
+
+from django.db import migrations, models
+
+
+def dedupe_skus(apps, schema_editor):
+    """
+    Blank SKUs become NULL, which the unique index allows any number of.
+    Of products sharing a SKU the oldest keeps it and later ones get a
+    suffixed SKU, so no product (or order line item pointing at one) is
+    lost.
+    """
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(sku='').update(sku=None)
+    duplicates = (
+        Product.objects.exclude(sku__isnull=True)
+        .values('sku')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+        .values_list('sku', flat=True)
+    )
+    for sku in list(duplicates):
+        products = Product.objects.filter(sku=sku).order_by('id')
+        for index, product in enumerate(products[1:], start=1):
+            product.sku = f'{sku}-duplicate-{index}'
+            product.save(update_fields=['sku'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_skus, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=254, null=True, unique=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Lower
 
 
 class Category(models.Model):
@@ -6,19 +8,43 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'Categories'
         
-    name = models.CharField(max_length=254)
+    name = models.CharField(max_length=254, db_index=True)
     friendly_name = models.CharField(max_length=254, null=True, blank=True)
 
+    # Aggregates over the category's products, maintained incrementally by
+    # products.category_stats as products are added, edited and deleted
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    min_price = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, editable=False)
+    max_price = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, editable=False)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
     def __str__(self):
         return self.name
 
     def get_friendly_name(self):
         return self.friendly_name
 
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
 
 class Product(models.Model):
+
+    class Meta:
+        # Composite (sort key, id) indexes for keyset pagination of the
+        # product list; see products.pagination
+        indexes = [
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_id_idx'),
+            models.Index(Lower('name'), 'id', name='product_lower_name_id_idx'),
+        ]
+
     category = models.ForeignKey('Category', null=True, blank=True, on_delete=models.SET_NULL)
-    sku = models.CharField(max_length=254, null=True, blank=True)
+    sku = models.CharField(max_length=254, null=True, blank=True, unique=True)
     name = models.CharField(max_length=254)
     description = models.TextField()
     has_sizes = models.BooleanField(default=False, null=True, blank=True)
@@ -26,6 +52,21 @@ class Product(models.Model):
     rating = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(null=True, blank=True)
+    # Manifest of resized copies of the image; see products.images
+    image_derivatives = models.JSONField(null=True, blank=True, editable=False)
+    # Maintained by products.search.PostgresSearchBackend
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+# Columns needed to render a product card on the grid; avoids loading the
+# long description and the search vector. Use with select_related('category').
+PRODUCT_CARD_FIELDS = (
+    'id', 'name', 'price', 'rating', 'image', 'image_url', 'image_derivatives',
+    'category', 'category__name', 'category__friendly_name',
+)
+
+# Columns needed to render a product as a bag line item
+BAG_PRODUCT_FIELDS = PRODUCT_CARD_FIELDS + ('sku', 'has_sizes')
@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+PRODUCTS_PER_PAGE = 24
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination ordered by a sort expression with the primary
+    key as tie-breaker. Each page continues from the (sort value, pk) of the
+    previous page's last row, so fetching a deep page costs the same as the
+    first one instead of scanning past an OFFSET.
+
+    Nullable sort values are always ordered last, in both directions.
+    Descending, that is the reverse of a (sort value, pk) index's order on
+    PostgreSQL, so a descending rating sort can't seek on
+    product_rating_id_idx and still reads past the skipped rows.
+    """
+
+    def __init__(self, queryset, sort_expression=None, descending=False,
+                 nullable=False, per_page=PRODUCTS_PER_PAGE):
+        self.descending = descending
+        self.nullable = nullable
+        self.per_page = per_page
+        self.has_sort_value = sort_expression is not None
+
+        if self.has_sort_value:
+            queryset = queryset.annotate(sort_value=sort_expression)
+            # Cursor values are converted to this before they are compared
+            self.output_field = queryset.query.annotations['sort_value'].output_field
+            sort_value = F('sort_value')
+            if descending:
+                ordering = [sort_value.desc(nulls_last=nullable), '-pk']
+            else:
+                ordering = [sort_value.asc(nulls_last=nullable), 'pk']
+        else:
+            ordering = ['-pk' if descending else 'pk']
+        self.queryset = queryset.order_by(*ordering)
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        payload = json.dumps([value, pk], default=str).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """ Return (value, pk), or None if the cursor is malformed """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return value, int(pk)
+        except (ValueError, TypeError):
+            return None
+
+    def _position(self, cursor):
+        """
+        The (sort value, pk) the cursor points at, with the value converted
+        to the sort's type, or None if the cursor is malformed or its value
+        doesn't fit this sort (e.g. a tampered cursor, or one from another
+        sort), so the listing falls back to the first page.
+        """
+        position = self.decode_cursor(cursor)
+        if position is None:
+            return None
+        value, pk = position
+        if not self.has_sort_value:
+            return None, pk
+        if value is None:
+            return position if self.nullable else None
+        try:
+            return self.output_field.to_python(value), pk
+        except (ValidationError, TypeError, ValueError):
+            return None
+
+    def _after(self, value, pk):
+        """ Rows that come after (value, pk) in the pagination order """
+        op = 'lt' if self.descending else 'gt'
+        after_pk = Q(**{f'pk__{op}': pk})
+        if not self.has_sort_value:
+            return after_pk
+        if value is None:
+            return Q(sort_value__isnull=True) & after_pk
+
+        after = Q(**{f'sort_value__{op}': value}) | (Q(sort_value=value) & after_pk)
+        # Redundant, but a bare range on the sort value lets the database
+        # seek on the (sort value, pk) index rather than scan from its start
+        after &= Q(**{f'sort_value__{op}e': value})
+        if self.nullable:
+            after |= Q(sort_value__isnull=True)
+        return after
+
+    def page(self, cursor=None):
+        """
+        Return (items, next_cursor) for the page following the cursor.
+        next_cursor is None on the last page.
+        """
+        queryset = self.queryset
+        position = self._position(cursor) if cursor else None
+        if position is not None:
+            queryset = queryset.filter(self._after(*position))
+
+        # Fetch one extra row to find out whether there is a next page
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            last = items[-1]
+            value = last.sort_value if self.has_sort_value else None
+            next_cursor = self.encode_cursor(value, last.pk)
+        return items, next_cursor
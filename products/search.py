@@ -0,0 +1,170 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+from .catalog import get_price_version
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class PostgresSearchBackend:
+    """
+    Full-text search over Product.search_vector, a tsvector of the name
+    (weight A) and description (weight B) backed by a GIN index.
+    Every query term is matched as a prefix and all terms must match.
+    """
+
+    vector = SearchVector('name', weight='A') + SearchVector('description', weight='B')
+
+    # ts_rank returns a float4, which doesn't survive the round trip through
+    # a float8 pagination cursor; ranks are compared as fixed point numbers
+    rank_field = DecimalField(max_digits=12, decimal_places=6)
+
+    def search(self, queryset, query):
+        """
+        Filter the queryset to matching products. Returns the queryset and
+        a relevance expression to order by, highest first.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none(), None
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms), search_type='raw')
+        queryset = queryset.filter(search_vector=search_query)
+        rank = Cast(SearchRank(F('search_vector'), search_query), self.rank_field)
+        return queryset, rank
+
+    def index_product(self, product):
+        Product.objects.filter(pk=product.pk).update(search_vector=self.vector)
+
+    def remove_product(self, product):
+        # The vector is stored on the product row, so it goes with it
+        pass
+
+    def rebuild(self):
+        Product.objects.update(search_vector=self.vector)
+
+
+class InvertedIndexSearchBackend:
+    """
+    Pure-Python inverted index for databases without full-text search
+    (SQLite in development). Built lazily per process and rebuilt whenever
+    the catalog price version moves, so edits made in other processes are
+    picked up too. Name matches score higher than description matches,
+    weighted by inverse document frequency.
+    """
+
+    NAME_WEIGHT = 3.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._terms = []
+        self._document_count = 0
+
+    def _build(self):
+        postings = defaultdict(dict)
+        document_count = 0
+        for pk, name, description in Product.objects.values_list(
+                'pk', 'name', 'description').iterator():
+            document_count += 1
+            for term in tokenize(name):
+                postings[term][pk] = postings[term].get(pk, 0) + self.NAME_WEIGHT
+            for term in tokenize(description):
+                postings[term][pk] = postings[term].get(pk, 0) + self.DESCRIPTION_WEIGHT
+        self._postings = dict(postings)
+        self._terms = sorted(self._postings)
+        self._document_count = document_count
+
+    def _ensure_current(self):
+        version = get_price_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build()
+                    self._version = version
+
+    def _prefix_matches(self, prefix):
+        """ Scores for every product with a term starting with prefix """
+        scores = defaultdict(float)
+        start = bisect.bisect_left(self._terms, prefix)
+        document_count = max(self._document_count, 1)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            postings = self._postings[term]
+            idf = math.log(1 + document_count / len(postings))
+            for pk, weight in postings.items():
+                scores[pk] += weight * idf
+        return scores
+
+    def scores(self, query):
+        """ {product pk: relevance} for products matching every term """
+        self._ensure_current()
+        result = None
+        for term in set(tokenize(query)):
+            matches = self._prefix_matches(term)
+            if result is None:
+                result = dict(matches)
+            else:
+                result = {pk: score + matches[pk]
+                          for pk, score in result.items() if pk in matches}
+            if not result:
+                break
+        return result or {}
+
+    def search(self, queryset, query):
+        """
+        Filter the queryset to every matching product; the listing pages
+        through them. The rank only orders them: it has one CASE branch per
+        distinct score, each matching the products with that score.
+        """
+        scores = self.scores(query)
+        if not scores:
+            return queryset.none(), None
+        by_score = defaultdict(list)
+        for pk, score in scores.items():
+            by_score[round(score, 6)].append(pk)
+        rank = Case(
+            *[When(pk__in=pks, then=Value(score)) for score, pks in by_score.items()],
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=scores.keys()), rank
+
+    def index_product(self, product):
+        # Saving a product bumps the price version, which triggers a rebuild
+        pass
+
+    def remove_product(self, product):
+        pass
+
+    def rebuild(self):
+        # Rebuilt lazily by the next search in each process
+        with self._lock:
+            self._version = None
+
+
+_backend = None
+
+
+def get_search_backend():
+    """ The search backend selected by settings.PRODUCT_SEARCH_BACKEND """
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.PRODUCT_SEARCH_BACKEND)()
+    return _backend
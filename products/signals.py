@@ -0,0 +1,103 @@
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import bump_price_version, bump_catalog_generation
+from .category_stats import product_added, product_changed, product_removed
+from .images import IMAGE_ERRORS, generate_product_derivatives
+from .models import Product, Category
+from .search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Product)
+def remember_stats_values(sender, instance, **kwargs):
+    """
+    Remember the stored category, price and rating of an edited product
+    so its category aggregates can be adjusted after the save, and its
+    stored image so derivatives are only rebuilt when it changes
+    """
+    instance._stats_values = None
+    instance._stored_image = None
+    if instance.pk:
+        stored = Product.objects.filter(pk=instance.pk).values_list(
+            'category_id', 'price', 'rating', 'image').first()
+        if stored is not None:
+            instance._stats_values = stored[:3]
+            instance._stored_image = stored[3]
+
+
+def rebuild_derivatives(product_id):
+    """
+    Rebuild a product's image derivatives. An image Pillow can't decode
+    (corrupt, or a decompression bomb) is logged and the product's pages
+    fall back to the original.
+    """
+    product = Product.objects.only('id', 'image', 'image_url').filter(pk=product_id).first()
+    if product is None:
+        return
+    try:
+        generate_product_derivatives(product)
+    except IMAGE_ERRORS:
+        logger.exception('Could not build image derivatives for product %s', product_id)
+        Product.objects.filter(pk=product_id).update(image_derivatives=None)
+
+
+@receiver(post_save, sender=Product)
+def bump_on_save(sender, instance, **kwargs):
+    """
+    Invalidate cached bag snapshots and product listings, update the
+    search index, category aggregates and image derivatives when a product
+    is added or edited
+    """
+    new_values = (instance.category_id, instance.price, instance.rating)
+    old_values = getattr(instance, '_stats_values', None)
+    if old_values is None:
+        product_added(*new_values)
+    else:
+        product_changed(tuple(old_values), new_values)
+
+    # Fixture loading (raw saves) leaves derivatives to build_image_derivatives
+    image_changed = (instance.image.name or None) != (getattr(instance, '_stored_image', None) or None)
+    if image_changed and not kwargs.get('raw'):
+        if settings.PRODUCT_IMAGE_DERIVATIVES_ON_SAVE:
+            # After the save commits, so a slow or failing encode can't hold
+            # or roll back the product's transaction
+            transaction.on_commit(partial(rebuild_derivatives, instance.pk))
+        else:
+            # The old image's derivatives are stale; build_image_derivatives
+            # picks up products without any
+            instance.image_derivatives = None
+            Product.objects.filter(pk=instance.pk).update(image_derivatives=None)
+
+    get_search_backend().index_product(instance)
+    # Only once the change is visible to other requests, or one of them
+    # could cache the old prices or listing under the new version
+    transaction.on_commit(bump_price_version)
+    transaction.on_commit(bump_catalog_generation)
+
+
+@receiver(post_delete, sender=Product)
+def bump_on_delete(sender, instance, **kwargs):
+    """
+    Invalidate cached bag snapshots and product listings, update the
+    search index and category aggregates when a product is deleted
+    """
+    product_removed(instance.category_id, instance.price, instance.rating)
+    get_search_backend().remove_product(instance)
+    transaction.on_commit(bump_price_version)
+    transaction.on_commit(bump_catalog_generation)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_on_category_change(sender, instance, **kwargs):
+    """
+    Invalidate cached product listings when a category changes
+    """
+    transaction.on_commit(bump_catalog_generation)
@@ -0,0 +1,42 @@
+from django import template
+from django.conf import settings
+
+from products.images import derivative_for, derivative_srcsets, derivative_url
+
+register = template.Library()
+
+# Rendered width of each derivative size in the page layouts, for the
+# sizes attribute that lets the browser pick from the srcset
+LAYOUT_SIZES = {
+    'thumb': '(min-width: 992px) 10vw, 25vw',
+    'card': '(min-width: 1200px) 25vw, (min-width: 992px) 33vw, (min-width: 576px) 50vw, 100vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+}
+
+
+@register.inclusion_tag('products/includes/product_image.html')
+def product_image(product, size='card', css_class='card-img-top img-fluid'):
+    """
+    A responsive <picture> for the product: WebP and JPEG srcsets of its
+    image derivatives, or the original image when it has none yet.
+    """
+    context = {'product': product, 'css_class': css_class}
+    manifest = product.image_derivatives
+    if manifest and manifest.get('sizes'):
+        srcsets = derivative_srcsets(manifest)
+        default = derivative_for(manifest, size)
+        context.update({
+            'webp_srcset': srcsets['webp'],
+            'jpg_srcset': srcsets['jpg'],
+            'sizes': LAYOUT_SIZES[size],
+            'src': derivative_url(default['jpg']),
+            'width': default['width'],
+            'height': default['height'],
+        })
+    elif product.image_url:
+        context['src'] = product.image_url
+    elif product.image:
+        context['src'] = product.image.url
+    else:
+        context['src'] = f'{settings.MEDIA_URL}noimage.png'
+    return context
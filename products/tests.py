@@ -1,3 +1,598 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+from .catalog import bump_catalog_generation
+from .images import build_derivatives
+from .models import Product, Category
+from .pagination import KeysetPaginator
+from .search import InvertedIndexSearchBackend
+from .views import SORT_EXPRESSIONS
+
+
+class ProductGridQueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [
+            Category.objects.create(name=f'category_{i}', friendly_name=f'Category {i}')
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def add_products(self, count):
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                description='A long description ' * 50,
+                price=Decimal('10.00') + i,
+                rating=Decimal('4.50'),
+                category=self.categories[i % len(self.categories)],
+            )
+            for i in range(count)
+        ])
+        # bulk_create doesn't send post_save
+        bump_catalog_generation()
+
+    def assert_grid_queries(self, url):
+        # One grouped query for the facet counts, one COUNT for the total,
+        # one query for the page of cards with categories joined in, and
+        # one for the navigation's category stats (cached per generation)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_grid_query_count_is_independent_of_catalog_size(self):
+        self.add_products(3)
+        self.assert_grid_queries(reverse('products'))
+
+        self.add_products(40)
+        response = self.assert_grid_queries(reverse('products'))
+        self.assertContains(response, 'Category 1')
+
+    def test_sorted_and_filtered_grid_query_budget(self):
+        self.add_products(40)
+        url = reverse('products') + '?sort=category&direction=desc'
+        self.assert_grid_queries(url)
+
+        # The category filter also loads the selected categories for badges;
+        # the navigation's category stats are already cached
+        url = reverse('products') + '?category=category_1,category_2'
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+    def test_grid_does_not_load_descriptions(self):
+        self.add_products(5)
+        response = self.client.get(reverse('products'))
+        for product in response.context['products']:
+            self.assertIn('description', product.get_deferred_fields())
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [
+            Category.objects.create(name=name, friendly_name=name.title())
+            for name in ('beds', 'jeans')
+        ]
+        # Repeated prices, ratings and names exercise the pk tie-break;
+        # every third product has no rating and every fourth no category
+        for i in range(11):
+            Product.objects.create(
+                name=['alpha', 'Beta', 'gamma'][i % 3],
+                description='',
+                price=Decimal('10.00') + i % 4,
+                rating=None if i % 3 == 0 else Decimal('4.50') - i % 2,
+                category=None if i % 4 == 0 else categories[i % 2],
+            )
+
+    def expected_order(self, sort, descending):
+        def sort_value(product):
+            return {
+                'price': product.price,
+                'rating': product.rating,
+                'name': product.name.lower(),
+                'category': product.category.name if product.category else None,
+            }[sort]
+
+        products = list(Product.objects.select_related('category'))
+        present = [p for p in products if sort_value(p) is not None]
+        present.sort(key=lambda p: (sort_value(p), p.pk), reverse=descending)
+        missing = sorted((p for p in products if sort_value(p) is None),
+                         key=lambda p: p.pk, reverse=descending)
+        # Nulls come last in both directions
+        return [p.pk for p in present + missing]
+
+    def paginator(self, sort, descending):
+        expression, nullable = SORT_EXPRESSIONS[sort]
+        return KeysetPaginator(Product.objects.all(), expression,
+                               descending=descending, nullable=nullable, per_page=3)
+
+    def walk(self, paginator):
+        pks, cursor = [], None
+        while True:
+            items, cursor = paginator.page(cursor)
+            pks.extend(item.pk for item in items)
+            if cursor is None:
+                return pks
+
+    def test_every_sort_and_direction_visits_each_product_once_in_order(self):
+        for sort in SORT_EXPRESSIONS:
+            for descending in (False, True):
+                with self.subTest(sort=sort, descending=descending):
+                    self.assertEqual(self.walk(self.paginator(sort, descending)),
+                                     self.expected_order(sort, descending))
+
+    def test_default_order_is_by_pk(self):
+        pks = list(Product.objects.order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual(self.walk(KeysetPaginator(Product.objects.all(), descending=True, per_page=4)), pks)
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        paginator = self.paginator('price', False)
+        first_page, _ = paginator.page()
+        for cursor in ('not-a-cursor', KeysetPaginator.encode_cursor('cheap', 1),
+                       KeysetPaginator.encode_cursor(['x'], 1),
+                       KeysetPaginator.encode_cursor(None, 1)):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(paginator.page(cursor)[0], first_page)
+
+        cursor = KeysetPaginator.encode_cursor('cheap', 1)
+        response = self.client.get(reverse('products'), {'sort': 'price', 'after': cursor})
+        self.assertEqual(response.status_code, 200)
+
+
+class InvertedIndexSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        def create(name, description):
+            return Product.objects.create(name=name, description=description, price=Decimal('5.00'))
+
+        cls.red_shirt = create('Red Shirt', 'A cotton shirt')
+        cls.blue_shirt = create('Blue Shirt', 'A shirt in blue linen')
+        cls.red_scarf = create('Scarf', 'Knitted from red wool')
+        cls.shirtdress = create('Shirtdress', 'Long and red')
+        cls.lamp = create('Lamp', 'A desk lamp')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = InvertedIndexSearchBackend()
+
+    def test_idf_counts_products_not_terms(self):
+        self.backend.scores('lamp')
+        self.assertEqual(self.backend._document_count, 5)
+
+    def test_name_matches_outrank_description_matches(self):
+        scores = self.backend.scores('red')
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        self.assertEqual(ranked[0], self.red_shirt.pk)
+        self.assertCountEqual(ranked[1:], [self.red_scarf.pk, self.shirtdress.pk])
+
+    def test_terms_match_as_prefixes(self):
+        self.assertCountEqual(self.backend.scores('shi'),
+                              [self.red_shirt.pk, self.blue_shirt.pk, self.shirtdress.pk])
+
+    def test_every_term_must_match(self):
+        self.assertCountEqual(self.backend.scores('red shirt'),
+                              [self.red_shirt.pk, self.shirtdress.pk])
+        self.assertEqual(self.backend.scores('blue lamp'), {})
+
+    def test_every_match_is_returned_in_rank_order(self):
+        products, rank = self.backend.search(Product.objects.all(), 'red')
+        ranked = list(products.annotate(rank=rank).order_by('-rank', 'pk'))
+        self.assertEqual(ranked[0], self.red_shirt)
+        self.assertCountEqual(ranked[1:], [self.red_scarf, self.shirtdress])
+        # Equal scores share one CASE branch
+        self.assertEqual(ranked[1].rank, ranked[2].rank)
+
+    def test_search_results_page_through_every_match(self):
+        Product.objects.bulk_create([
+            Product(name=f'Red sock {i}', description='', price=Decimal(i + 1))
+            for i in range(30)
+        ])
+        self.backend.rebuild()
+        with mock.patch('products.views.get_search_backend', return_value=self.backend):
+            response = self.client.get(reverse('products'), {'q': 'red', 'sort': 'price'})
+            self.assertContains(response, '33 Products')
+            self.assertIn('after=', response.context['product_grid'])
+
+    def test_listing_orders_search_results_by_relevance(self):
+        with mock.patch('products.views.get_search_backend', return_value=self.backend):
+            response = self.client.get(reverse('products'), {'q': 'red'})
+        self.assertContains(response, '3 Products')
+        content = response.content.decode()
+        self.assertLess(content.index('Red Shirt'), content.index('Scarf'))
+
+
+class ProductListingCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='jeans', friendly_name='Jeans')
+        self.product = Product.objects.create(
+            name='Blue Jeans', description='Denim', price=Decimal('20.00'),
+            category=self.category)
+        self.url = reverse('products') + '?category=jeans&sort=price&direction=asc'
+
+    def test_repeat_listing_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Blue Jeans')
+        self.assertContains(response, '1 Products')
+
+    def test_product_change_invalidates_listing_once_committed(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.name = 'Black Jeans'
+            self.product.save()
+        # Not before the edit commits, or a concurrent request could cache
+        # the old listing under the new generation
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'Blue Jeans')
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Black Jeans')
+        self.assertNotContains(response, 'Blue Jeans')
+
+    def test_category_change_invalidates_listing(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.friendly_name = 'Denim'
+            self.category.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Denim')
+
+
+class ProductFacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+        shirts = Category.objects.create(name='shirts', friendly_name='Shirts')
+        for name, price, category in (
+            ('Blue Jeans', '20.00', jeans),
+            ('Black Jeans', '60.00', jeans),
+            ('Blue Shirt', '30.00', shirts),
+            ('White Shirt', '35.00', shirts),
+        ):
+            Product.objects.create(name=name, description=name, price=Decimal(price), category=category)
+
+    def test_counts_follow_category_and_search_filters(self):
+        facets = self.client.get(reverse('products')).context['facets']
+        self.assertEqual([(c['name'], c['count']) for c in facets['categories']],
+                         [('jeans', 2), ('shirts', 2)])
+        self.assertEqual([(b['key'], b['count']) for b in facets['price_bands']],
+                         [('under-25', 1), ('25-50', 2), ('50-100', 1)])
+
+        facets = self.client.get(reverse('products') + '?q=blue').context['facets']
+        self.assertEqual([(c['name'], c['count']) for c in facets['categories']],
+                         [('jeans', 1), ('shirts', 1)])
+
+    def test_price_band_filters_results_but_not_facets(self):
+        response = self.client.get(reverse('products') + '?price=25-50')
+        self.assertContains(response, '2 Products')
+        self.assertEqual(len(response.context['facets']['price_bands']), 3)
+
+
+class CategoryStatsTests(TestCase):
+
+    def setUp(self):
+        self.jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+        self.shirts = Category.objects.create(name='shirts', friendly_name='Shirts')
+
+    def create(self, price, rating=None, category=None):
+        return Product.objects.create(
+            name='Product', description='Product', price=Decimal(price),
+            rating=Decimal(rating) if rating else None,
+            category=category or self.jeans)
+
+    def assert_stats(self, category, count, min_price, max_price, avg_rating):
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.product_count, category.min_price, category.max_price, category.avg_rating),
+            (count, min_price and Decimal(min_price), max_price and Decimal(max_price),
+             avg_rating and Decimal(avg_rating)))
+
+    def test_stats_follow_product_changes(self):
+        cheap = self.create('10.00', '4.00')
+        dear = self.create('50.00', '3.00')
+        self.create('30.00')
+        self.assert_stats(self.jeans, 3, '10.00', '50.00', '3.50')
+
+        cheap.price = Decimal('20.00')
+        cheap.save()
+        self.assert_stats(self.jeans, 3, '20.00', '50.00', '3.50')
+
+        dear.category = self.shirts
+        dear.save()
+        self.assert_stats(self.jeans, 2, '20.00', '30.00', '4.00')
+        self.assert_stats(self.shirts, 1, '50.00', '50.00', '3.00')
+
+        dear.delete()
+        self.assert_stats(self.shirts, 0, None, None, None)
+
+
+class ProductImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage = 'django.core.files.storage.FileSystemStorage'
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE=storage, PRODUCT_IMAGE_STORAGE=storage)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def jpeg(self, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'teal').save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def test_derivatives_are_content_hashed_and_never_upscaled(self):
+        manifest = build_derivatives(self.jpeg(600, 300))
+        self.assertEqual(
+            [(size['name'], size['width'], size['height']) for size in manifest['sizes']],
+            [('thumb', 160, 80), ('card', 400, 200), ('detail', 600, 300)])
+        for size in manifest['sizes']:
+            self.assertIn(manifest['hash'], size['webp'])
+            with Image.open(f"{self.media_root}/{size['webp']}") as image:
+                self.assertEqual(image.size, (size['width'], size['height']))
+        self.assertEqual(build_derivatives(self.jpeg(600, 300)), manifest)
+
+    def create_with_image(self, width, height):
+        # Derivatives are built once the save commits
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='Teal shirt', description='Shirt', price=Decimal('10.00'),
+                image=SimpleUploadedFile('shirt.jpg', self.jpeg(width, height)))
+        product.refresh_from_db()
+        return product
+
+    def test_uploaded_image_gets_a_srcset_in_the_grid(self):
+        product = self.create_with_image(1200, 1200)
+        self.assertEqual(len(product.image_derivatives['sizes']), 3)
+
+        response = self.client.get(reverse('products'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'card-400.jpg 400w')
+        self.assertNotContains(response, 'src="/media/shirt.jpg"')
+
+    def test_undecodable_upload_is_logged_and_the_save_succeeds(self):
+        # Over twice the pixel limit Pillow refuses to decode the image
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), \
+                self.assertLogs('products.signals', 'ERROR') as logs:
+            product = self.create_with_image(100, 100)
+        self.assertIn('DecompressionBombError', logs.output[0])
+        self.assertIsNone(product.image_derivatives)
+        self.assertEqual(product.name, 'Teal shirt')
+
+    def test_encoding_can_be_left_to_the_build_command(self):
+        with override_settings(PRODUCT_IMAGE_DERIVATIVES_ON_SAVE=False):
+            product = self.create_with_image(600, 600)
+        self.assertIsNone(product.image_derivatives)
+
+        call_command('build_image_derivatives', stdout=io.StringIO())
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_derivatives['sizes']), 3)
+
+
+class UploadMediaCommandTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.upload_root = tempfile.mkdtemp()
+        for path in (self.media_root, self.upload_root):
+            self.addCleanup(shutil.rmtree, path)
+        os.makedirs(os.path.join(self.media_root, 'sub'))
+        for name in ('a.jpg', 'sub/b.jpg'):
+            with open(os.path.join(self.media_root, name), 'wb') as f:
+                f.write(name.encode())
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_UPLOAD_ROOT=self.upload_root,
+            MEDIA_UPLOAD_BACKEND='products.media_upload.FileSystemUploadBackend')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self):
+        out = io.StringIO()
+        call_command('upload_media', workers=2, stdout=out)
+        return out.getvalue()
+
+    def test_only_new_or_changed_files_are_uploaded(self):
+        self.assertIn('Done. 2 uploaded', self.upload())
+        with open(os.path.join(self.upload_root, 'sub', 'b.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'sub/b.jpg')
+
+        self.assertIn('Done. 0 uploaded', self.upload())
+
+        with open(os.path.join(self.media_root, 'a.jpg'), 'wb') as f:
+            f.write(b'changed')
+        output = self.upload()
+        self.assertIn('Done. 1 uploaded', output)
+        self.assertIn('Uploaded a.jpg', output)
+
+    def test_derivatives_are_not_uploaded(self):
+        os.makedirs(os.path.join(self.media_root, 'derivatives', 'ab'))
+        with open(os.path.join(self.media_root, 'derivatives', 'ab', 'card-400.jpg'), 'wb') as f:
+            f.write(b'card')
+        self.assertIn('Done. 2 uploaded', self.upload())
+        self.assertFalse(os.path.exists(os.path.join(self.upload_root, 'derivatives')))
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+    CLOUDINARY_MEDIA_BASE_URL='https://cdn.example.com/v1/',
+)
+class UpdateCloudinaryUrlsCommandTests(TestCase):
+
+    def setUp(self):
+        def create(name, image, image_url=None):
+            return Product.objects.create(
+                name=name, description='', price=Decimal('5.00'), image=image, image_url=image_url)
+
+        self.new = [create(f'New {i}', f'shirts/new{i}.jpg') for i in range(5)]
+        self.linked = create('Linked', 'old.jpg', 'https://old.example.com/old.jpg')
+        self.without_image = create('No image', '')
+
+    def update(self, **options):
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_cloudinary_urls', stdout=out, **options)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "products_product"')]
+        return out.getvalue(), len(updates)
+
+    def image_urls(self):
+        return dict(Product.objects.values_list('name', 'image_url'))
+
+    def test_new_products_are_pointed_at_the_base_in_batches(self):
+        output, updates = self.update(batch_size=2)
+        self.assertIn('5 products updated', output)
+        # One bulk UPDATE per batch of two
+        self.assertEqual(updates, 3)
+        urls = self.image_urls()
+        self.assertEqual(urls['New 0'], 'https://cdn.example.com/v1/new0.jpg')
+        self.assertEqual(urls['Linked'], 'https://old.example.com/old.jpg')
+        self.assertIsNone(urls['No image'])
+
+        self.assertIn('0 products updated', self.update()[0])
+
+    def test_overwrite_and_base(self):
+        output, _ = self.update(overwrite=True, base='https://img.example.com/shop')
+        self.assertIn('6 products updated', output)
+        self.assertEqual(self.image_urls()['Linked'], 'https://img.example.com/shop/old.jpg')
+
+    def test_dry_run_changes_nothing(self):
+        before = self.image_urls()
+        output, updates = self.update(dry_run=True, overwrite=True)
+        self.assertIn('6 products would be updated', output)
+        self.assertEqual(updates, 0)
+        self.assertEqual(self.image_urls(), before)
+
+
+class CatalogImportExportTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_upserts_by_sku_and_round_trips(self):
+        Category.objects.create(name='jeans', friendly_name='Jeans')
+        path = self.write('catalog.csv', (
+            'sku,name,description,price,rating,category,has_sizes,image_url,image\n'
+            'sku1,Jeans,Blue,40.00,4.50,jeans,true,,\n'
+            'sku2,Hat,Red,10.00,,hats,false,,\n'
+            ',No sku,,1.00,,,,,\n'
+        ))
+        out = io.StringIO()
+        call_command('import_catalog', path, batch_size=1, stdout=out, stderr=io.StringIO())
+        self.assertIn('2 created, 0 updated, 0 unchanged, 1 skipped', out.getvalue())
+        self.assertEqual(Category.objects.get(name='hats').product_count, 1)
+
+        # Fixture-style JSON updates by sku and leaves unchanged rows alone
+        path = self.write('catalog.json', json.dumps([
+            {'model': 'products.product', 'fields': {
+                'sku': 'sku1', 'name': 'Jeans', 'description': 'Blue',
+                'price': 45.5, 'rating': 4.5, 'category': 'jeans', 'has_sizes': True}},
+            {'sku': 'sku2', 'name': 'Hat', 'description': 'Red', 'price': '10.00',
+             'category': 'hats', 'has_sizes': False},
+        ]))
+        out = io.StringIO()
+        call_command('import_catalog', path, stdout=out)
+        self.assertIn('0 created, 1 updated, 1 unchanged', out.getvalue())
+        self.assertEqual(Product.objects.get(sku='sku1').price, Decimal('45.50'))
+        self.assertEqual(Category.objects.get(name='jeans').max_price, Decimal('45.50'))
+
+        export_path = os.path.join(self.directory, 'export.jsonl')
+        call_command('export_catalog', export_path, stdout=io.StringIO())
+        with open(export_path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(
+            [(r['sku'], r['price'], r['category']) for r in records],
+            [('sku1', '45.50', 'jeans'), ('sku2', '10.00', 'hats')])
+
+
+    def test_invalid_rows_are_skipped_without_failing_the_batch(self):
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'sku': 'ok1', 'name': 'Mug', 'price': 19.99, 'category': '2024'},
+            {'sku': 'long', 'name': 'N' * 300, 'price': '5.00'},
+            {'sku': 'precise', 'name': 'Cup', 'price': '5.005'},
+            {'sku': 'big', 'name': 'Sofa', 'price': '1234567'},
+            {'sku': 'ok2', 'name': 'Bowl', 'price': '7.00', 'category': 9999},
+            {'sku': 'ok3', 'name': 'Plate', 'price': '3.00'},
+        ]))
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+
+        self.assertIn('2 created, 0 updated, 0 unchanged, 4 skipped', out.getvalue())
+        for message in ('name: Ensure this value has at most 254 characters',
+                        'price: Ensure that there are no more than 2 decimal places',
+                        'price: Ensure that there are no more than 6 digits',
+                        'Unknown category id 9999'):
+            self.assertIn(message, err.getvalue())
+        mug = Product.objects.get(sku='ok1')
+        self.assertEqual(mug.price, Decimal('19.99'))
+        # A numeric string is a category name, not a pk
+        self.assertEqual(mug.category.name, '2024')
+
+    def test_records_that_are_not_objects_are_skipped(self):
+        path = self.write('catalog.json', json.dumps([
+            [1, 2],
+            'sku1',
+            {'sku': 'sku1', 'name': 'Mug', 'price': '4.00'},
+        ]))
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+        self.assertIn('1 created, 0 updated, 0 unchanged, 2 skipped', out.getvalue())
+        self.assertIn('not an object', err.getvalue())
+
+
+class ProductSkuLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(sku=f'sku{i}', name=f'Product {i}', description='', price=Decimal('5.00'))
+            for i in range(3)
+        ])
+
+    def test_batch_lookup_uses_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('products_by_sku'), {'sku': ['sku0,sku2', 'nope']})
+        data = response.json()
+        self.assertEqual(sorted(data['products']), ['sku0', 'sku2'])
+        self.assertEqual(data['products']['sku2']['name'], 'Product 2')
+        self.assertEqual(data['missing'], ['nope'])
+
+    def test_lookup_requires_a_sku(self):
+        response = self.client.get(reverse('products_by_sku'))
+        self.assertEqual(response.status_code, 400)
@@ -1,38 +1,75 @@
+import hashlib
+
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.core.cache import cache
+from django.db.models import F
 from django.db.models.functions import Lower
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_GET
 
-from .models import Product, Category
+from .catalog import get_catalog_generation
+from .facets import facet_counts, price_band_filter
+from .models import Product, Category, PRODUCT_CARD_FIELDS
 from .forms import ProductForm
+from .lookup import MAX_SKUS_PER_LOOKUP, get_products_by_sku
+from .pagination import KeysetPaginator
+from .search import get_search_backend
 
 # Create your views here.
 
+# Query parameters that change what the product listing shows
+LISTING_PARAMS = ('sort', 'direction', 'category', 'q', 'price', 'after')
+
+# Query parameters that facet counts depend on
+FACET_PARAMS = ('category', 'q')
+
+# The catalog generation invalidates listings; this only bounds cache size
+LISTING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Sort keys accepted by all_products: (sort expression, nullable)
+SORT_EXPRESSIONS = {
+    'price': (F('price'), False),
+    'rating': (F('rating'), True),
+    'name': (Lower('name'), False),
+    'category': (F('category__name'), True),
+}
+
+
+def listing_cache_key(request, kind='listing', params=LISTING_PARAMS):
+    """ Cache key for a cached part of the product listing """
+    values = [request.GET.get(param) for param in params]
+    # Store owners see edit/delete links on every card
+    values.append(request.user.is_superuser)
+    digest = hashlib.sha1(repr(values).encode()).hexdigest()
+    return f'products:{kind}:{get_catalog_generation()}:{digest}'
+
+
 def all_products(request):
     """ A view to show all products, including sorting and search queries """
 
-    products = Product.objects.all()
+    products = Product.objects.select_related('category').only(*PRODUCT_CARD_FIELDS)
     query = None
     categories = None
+    price_band = None
     sort = None
     direction = None
+    sort_expression = None
+    nullable = False
+    descending = False
 
     if request.GET:
         if 'sort' in request.GET:
             sortkey = request.GET['sort']
             sort = sortkey
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-            if sortkey == 'category':
-                sortkey = 'category__name'
+            if sortkey in SORT_EXPRESSIONS:
+                sort_expression, nullable = SORT_EXPRESSIONS[sortkey]
             if 'direction' in request.GET:
                 direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
-            products = products.order_by(sortkey)
-            
+                descending = sort_expression is not None and direction == 'desc'
+
         if 'category' in request.GET:
             categories = request.GET['category'].split(',')
             products = products.filter(category__name__in=categories)
@@ -44,16 +81,83 @@ def all_products(request):
                 messages.error(request, "You didn't enter any search criteria!")
                 return redirect(reverse('products'))
             
-            queries = Q(name__icontains=query) | Q(description__icontains=query)
-            products = products.filter(queries)
+            products, rank = get_search_backend().search(products, query)
+            if sort_expression is None:
+                # Most relevant first unless another sort was asked for
+                sort_expression, nullable, descending = rank, False, True
+
+    # Facet counts follow the category and search filters but not the
+    # price band, so the other bands stay visible once one is picked
+    facets_key = listing_cache_key(request, 'facets', FACET_PARAMS)
+    facets = cache.get(facets_key)
+    if facets is None:
+        facets = facet_counts(products)
+        cache.set(facets_key, facets, LISTING_CACHE_TIMEOUT)
+
+    if 'price' in request.GET:
+        band_filter = price_band_filter(request.GET['price'])
+        if band_filter is not None:
+            price_band = request.GET['price']
+            products = products.filter(band_filter)
 
     current_sorting = f'{sort}_{direction}'
+    cursor = request.GET.get('after')
+
+    # Rendered grids are cached per filter/sort/page; the key includes the
+    # catalog generation, which moves on any product or category change
+    cache_key = listing_cache_key(request)
+    listing = cache.get(cache_key)
+    if listing is None:
+        paginator = KeysetPaginator(products, sort_expression,
+                                    descending=descending,
+                                    nullable=nullable)
+        page_products, next_cursor = paginator.page(cursor)
+
+        # Pager links only carry the parameters that are part of the key
+        listing_query = request.GET.copy()
+        for param in list(listing_query):
+            if param not in LISTING_PARAMS:
+                del listing_query[param]
+
+        next_page_query = None
+        if next_cursor:
+            params = listing_query.copy()
+            params['after'] = next_cursor
+            next_page_query = params.urlencode()
+
+        first_page_query = None
+        if cursor:
+            params = listing_query.copy()
+            del params['after']
+            first_page_query = params.urlencode()
+
+        product_grid = render_to_string('products/includes/product_grid.html', {
+            'products': page_products,
+            'next_page_query': next_page_query,
+            'first_page_query': first_page_query,
+        }, request=request)
+
+        listing = {
+            'product_grid': product_grid,
+            'product_total': products.count(),
+            'current_categories': list(categories) if categories is not None else None,
+        }
+        cache.set(cache_key, listing, LISTING_CACHE_TIMEOUT)
+
+    facet_query = request.GET.copy()
+    for param in list(facet_query):
+        if param not in LISTING_PARAMS or param in ('price', 'after'):
+            del facet_query[param]
 
     context = {
-        'products': products,
+        'product_grid': listing['product_grid'],
+        'product_total': listing['product_total'],
         'search_term': query,
-        'current_categories': categories,
+        'current_categories': listing['current_categories'],
         'current_sorting': current_sorting,
+        'facets': facets,
+        'facet_query': facet_query.urlencode(),
+        'current_price_band': price_band,
     }
 
     return render(request, 'products/products.html', context)
@@ -62,7 +166,9 @@ def all_products(request):
 def product_detail(request, product_id):
     """ A view to show individual product details """
 
-    product = get_object_or_404(Product, pk=product_id)
+    product = get_object_or_404(
+        Product.objects.select_related('category').defer('search_vector'),
+        pk=product_id)
 
     context = {
         'product': product,
@@ -71,6 +177,45 @@ def product_detail(request, product_id):
     return render(request, 'products/product_detail.html', context)
 
 
+@require_GET
+def products_by_sku(request):
+    """
+    A view to look up products by SKU. Takes one or more sku parameters,
+    each a SKU or a comma separated list, and returns the matching
+    products as JSON from a single query.
+    """
+    skus = list(dict.fromkeys(
+        sku.strip()
+        for value in request.GET.getlist('sku')
+        for sku in value.split(',')
+        if sku.strip()
+    ))
+    if not skus:
+        return JsonResponse({'error': 'No sku given.'}, status=400)
+    if len(skus) > MAX_SKUS_PER_LOOKUP:
+        return JsonResponse(
+            {'error': f'At most {MAX_SKUS_PER_LOOKUP} SKUs per request.'}, status=400)
+
+    found = get_products_by_sku(
+        skus, Product.objects.select_related('category').only(*PRODUCT_CARD_FIELDS, 'sku'))
+    products = {
+        sku: {
+            'id': product.id,
+            'sku': product.sku,
+            'name': product.name,
+            'price': str(product.price),
+            'rating': str(product.rating) if product.rating is not None else None,
+            'category': product.category.name if product.category else None,
+            'url': reverse('product_detail', args=[product.id]),
+        }
+        for sku, product in found.items()
+    }
+    return JsonResponse({
+        'products': products,
+        'missing': [sku for sku in skus if sku not in products],
+    })
+
+
 @login_required
 def add_product(request):
     """ Add a product to the store """
@@ -1,3 +1,67 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from checkout.models import Order, OrderLineItem
+from products.models import Product
 
 # Create your tests here.
+
+
+class ProfileOrderHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='password')
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=Decimal('5.00'))
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user_profile=self.user.userprofile, full_name='Shopper',
+                email='shopper@example.com', phone_number='1', country='GB',
+                town_or_city='Town', street_address1='Street')
+            OrderLineItem.objects.bulk_create([
+                OrderLineItem(order=order, product=product, quantity=1,
+                              lineitem_total=product.price)
+                for product in self.products
+            ])
+
+    def profile_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.add_orders(2)
+        # The first request also fills the navigation's category stats cache
+        self.profile_queries()
+        few = self.profile_queries()
+        self.add_orders(20)
+        self.assertEqual(self.profile_queries(), few)
+
+    def test_history_is_paginated_newest_first(self):
+        self.add_orders(12)
+        newest = Order.objects.order_by('-date', '-id').first()
+
+        response = self.client.get(reverse('profile'))
+        orders = response.context['orders']
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(orders[0], newest)
+        self.assertContains(response, 'Older orders')
+
+        response = self.client.get(reverse('profile'), {'page': 2})
+        self.assertEqual(len(response.context['orders']), 2)
@@ -2,12 +2,17 @@
 from django.shortcuts import render, get_object_or_404  # Used to render templates and safely fetch objects
 from django.contrib import messages  # Used to pass one-time messages to templates (like success notifications)
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator  # Splits the order history into pages
+from django.db.models import Prefetch
 # Importing the UserProfile model and associated form
 from .models import UserProfile
 from .forms import UserProfileForm
 
-# Importing the Order model from the checkout app
-from checkout.models import Order
+# Importing the Order models from the checkout app
+from checkout.models import Order, OrderLineItem
+
+# Number of orders shown per page of the profile's order history
+ORDERS_PER_PAGE = 10
 
 @login_required
 def profile(request):
@@ -32,8 +37,20 @@ def profile(request):
     else:  # If not POST, display the form pre-filled with existing profile data
         form = UserProfileForm(instance=profile)
 
-    # Retrieve all orders associated with this user profile
-    orders = profile.orders.all()
+    # Retrieve one page of this user's orders, newest first. Line items and
+    # their products are loaded with one extra query for the whole page,
+    # rather than two queries per order, so the page costs the same number
+    # of queries however many orders there are.
+    lineitems = OrderLineItem.objects.select_related('product').only(
+        'order', 'quantity', 'product_size',
+        'product__name', 'product__has_sizes',
+    )
+    orders = (
+        profile.orders.order_by('-date', '-id')
+        .only('order_number', 'date', 'grand_total', 'user_profile')
+        .prefetch_related(Prefetch('lineitems', queryset=lineitems))
+    )
+    orders = Paginator(orders, ORDERS_PER_PAGE).get_page(request.GET.get('page'))
 
     # Render the profile page with the form and order list
     template = 'profiles/profile.html'
@@ -63,6 +80,7 @@ def order_history(request, order_number):
     template = 'checkout/checkout_success.html'
     context = {
         'order': order,
+        'lineitems': order.get_snapshot()['lineitems'],  # Line items as purchased, without querying them
         'from_profile': True  # This flag can help modify display in the template (e.g., hide "continue shopping" links)
     }
 